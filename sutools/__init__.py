@@ -1,5 +1,5 @@
 from sutools import cli_handler, log_handler, meta_handler, bench_handler
-import inspect, os, logging, datetime
+import os, logging, datetime
 
 # init store
 store = meta_handler.Store()
@@ -16,24 +16,26 @@ def register(func):
     return func
 
 
-def cli(desc = None, logs = False):
+def cli(desc = None, logs = False, cache = False, loop_factory = None):
     '''init cli and register to store
     
     :param desc: description of the CLI
     :param logs: enable logging in CLI
+    :param cache: cache command specifications on disk, True for the user cache folder or a folder path
+    :param loop_factory: callable creating the event loops of async commands, i.e. uvloop.new_event_loop
     '''
 
     if store.log:
-        cli_obj = cli_handler.CLI(desc, logs, store.log)
+        cli_obj = cli_handler.CLI(desc, logs, store.log, cache=cache, loop_factory=loop_factory)
     else:
-        cli_obj = cli_handler.CLI(desc, logs)
+        cli_obj = cli_handler.CLI(desc, logs, cache=cache, loop_factory=loop_factory)
 
     cli_obj.add_funcs(store.funcs)
     cli_obj.parse()
     store.add_cli(cli_obj)
     return cli_obj
     
-def logger(name = os.path.basename(inspect.stack()[-1].filename)[:-3], 
+def logger(name = meta_handler.prog_name(), 
            loggers = None, 
            loglvl = logging.INFO,
            filename = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'), 
@@ -45,7 +47,16 @@ def logger(name = os.path.basename(inspect.stack()[-1].filename)[:-3],
            file = True, 
            streamfmt = logging.Formatter('%(asctime)s, %(msecs)d %(name)s %(levelname)s %(message)s', datefmt='%H:%M:%S'),
            shandler = logging.StreamHandler(),
-           stream = False):
+           stream = False,
+           queue = False,
+           queue_size = 10000,
+           overflow = 'block',
+           buffer_size = None,
+           flush_interval = 1.0,
+           flush_level = logging.ERROR,
+           structured = False,
+           rotate_size = None,
+           rotate_interval = None):
     '''init logger object and register to store
 
     :param name: name of the logger
@@ -61,11 +72,24 @@ def logger(name = os.path.basename(inspect.stack()[-1].filename)[:-3],
     :param streamfmt: format of the stream logger
     :param shandler: stream handler to use for logging
     :param stream: toggle stream logging
+    :param queue: toggle writing logs from a background thread, logging calls only enqueue records
+    :param queue_size: maximum number of queued records
+    :param overflow: policy of a full queue; 'block', 'drop' the new record or 'drop-oldest'
+    :param buffer_size: buffer file writes up to this many characters, unbuffered when None
+    :param flush_interval: seconds between writes of a buffered file
+    :param flush_level: log level written to a buffered file immediately
+    :param structured: write json lines with log_handler.JsonFormatter instead of filefmt and streamfmt
+    :param rotate_size: start a new log file once the file holds this many bytes
+    :param rotate_interval: start a new log file after this many seconds or a timeout string, i.e. '1d'
 
     :Timeout String: <int><time_unit> - '10d': represents 10 days
     :Time Units: { "m": "minutes", "h": "hours", "d": "days", "o": "months", "y": "years" }
     '''
 
+    # structured logs share one json formatter
+    if structured:
+        filefmt = streamfmt = log_handler.JsonFormatter()
+
     # if check for filepath must be inside function because filename is not initialized
     if not filepath:
         filepath = os.path.join('logs', name, f'{filename}.log')
@@ -77,14 +101,19 @@ def logger(name = os.path.basename(inspect.stack()[-1].filename)[:-3],
         os.makedirs(os.path.dirname(filepath)) # make parent directory tree for given filepath
     
     # if check for handler must be inside function because filename is not initialized
-    if not fhandler:
+    if not fhandler and buffer_size:
+        fhandler = log_handler.BufferedFileHandler(filepath, 'w', buffer_size=buffer_size,
+                                                   flush_interval=flush_interval, flush_level=flush_level)
+    elif not fhandler:
         fhandler = logging.FileHandler(filepath, 'w')
 
     # if check for loggers must be inside function because func keys will be empty at initialization
     if not loggers and store.funcs:
-        log_obj = log_handler.Logger(name, list(store.funcs.keys()), loglvl, filename, filepath, filefmt, fhandler, filecap, filetimeout, file, streamfmt, shandler, stream)
+        log_obj = log_handler.Logger(name, list(store.funcs.keys()), loglvl, filename, filepath, filefmt, fhandler, filecap, filetimeout, file, streamfmt, shandler, stream, queue, queue_size, overflow,
+                                     rotate_size=rotate_size, rotate_interval=rotate_interval)
     else:
-        log_obj = log_handler.Logger(name, loggers, loglvl, filename, filepath, filefmt, fhandler, filecap, filetimeout, file, streamfmt, shandler, stream)
+        log_obj = log_handler.Logger(name, loggers, loglvl, filename, filepath, filefmt, fhandler, filecap, filetimeout, file, streamfmt, shandler, stream, queue, queue_size, overflow,
+                                     rotate_size=rotate_size, rotate_interval=rotate_interval)
     store.add_log(log_obj)
     return log_obj
 
@@ -0,0 +1,45 @@
+"""sutools command line utilities."""
+import sys
+import sutools as su
+from sutools import bench_handler, cli_handler
+
+
+@su.register
+def baseline(name: str, source: str, folder: str = 'baselines') -> str:
+    '''save exported benchy records as a named baseline'''
+    return bench_handler.save_baseline(name, source, folder)
+
+
+@su.register
+def compare(baseline: str, current: str, threshold: float = 0.05, alpha: float = 0.05, metric: str = 'benchmark'):
+    '''compare benchy records against a baseline, exits with 1 on regressions'''
+    rows = bench_handler.compare(baseline, current, metric=metric, threshold=threshold, alpha=alpha)
+    print(bench_handler.table(rows))
+    if bench_handler.regressions(rows):
+        sys.exit(1)
+
+
+def complete(argv):
+    '''print completions of the last word of a module command line, `module.py [words...]`, from its cli cache'''
+    # words are completed as typed, key=value and --opt=value words are not arguments here
+    if argv[:1] == ['--']:
+        argv = argv[1:]
+    if argv:
+        print('\n'.join(cli_handler.complete(argv[0], argv[1:])))
+
+
+if __name__ == '__main__':
+    # forward a command line to a cli server as is, without parsing it here
+    if sys.argv[1:2] == ['call']:
+        argv = sys.argv[2:]
+        forward_stdin = argv[:1] != ['-n']
+        if not forward_stdin:
+            argv = argv[1:]
+        if not argv:
+            sys.exit('usage: python -m sutools call [-n] SOCKET [command args...]')
+        sys.exit(cli_handler.client(argv[0], argv[1:], forward_stdin))
+    # complete raw command lines, without parsing them here
+    if sys.argv[1:2] == ['complete']:
+        complete(sys.argv[2:])
+        sys.exit()
+    su.cli(desc = __doc__)
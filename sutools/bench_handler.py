@@ -1,17 +1,801 @@
-import time
+import time, math, itertools, threading, tracemalloc, gc
+import os, sys, struct, atexit, weakref
+from array import array
+from collections import deque
+from sutools import meta_handler
+
+# numeric sample fields aggregated per function in streaming mode
+METRICS = ('benchmark', 'first', 'items', 'throughput', 'peak', 'net', 'cpu', 'thread_cpu', 'gc')
+
+
+# header of an exported column; magic, function name length, metric name length, row count
+CHUNK = struct.Struct('<4sHHI')
+MAGIC = b'BNCH'
+
+
+# time spent in garbage collection per thread, collections run in the thread triggering them
+gc_time = threading.local()
+
+
+def gc_callback(phase, info):
+    '''accumulate the duration of garbage collections in the collecting thread'''
+    if phase == 'start':
+        gc_time.start = time.perf_counter()
+    elif hasattr(gc_time, 'start'):
+        gc_time.total = getattr(gc_time, 'total', 0.0) + time.perf_counter() - gc_time.start
+
+
+# benchy instances, held weakly so temporary ones and their records can be collected
+instances = weakref.WeakSet()
+
+
+def exit_all():
+    '''flush the remaining records of every live benchy at interpreter exit'''
+    for benchy in list(instances):
+        benchy._exit()
+
+
+def forked_all():
+    '''clear the records every live benchy copied from the parent process'''
+    for benchy in list(instances):
+        benchy._forked()
+
+
+def exit_weak(ref):
+    '''flush a benchy at the exit of a multiprocessing worker if it is still alive'''
+    benchy = ref()
+    if benchy is not None:
+        benchy._exit()
+
+
+def finalize_weak(benchy):
+    '''register the exit flush of a multiprocessing worker
+
+    registered after the worker clears the finalizers it copied from its parent
+    '''
+    util = sys.modules['multiprocessing.util']
+    util.Finalize(None, exit_weak, args=(weakref.ref(benchy),), exitpriority=10)
+
+
+# one hook each for all instances, per instance hooks could never be removed
+atexit.register(exit_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forked_all)
+
+
+def task_name():
+    '''name of the running asyncio task if any'''
+    # no task can be running when asyncio was never imported
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return None
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return task.get_name() if task else None
+
+
+def summarize_value(data):
+    '''summarize scalar data by value'''
+    return {'type': type(data).__name__, 'value': data}
+
+
+def summarize_length(data):
+    '''summarize sized data by length'''
+    return {'type': type(data).__name__, 'length': len(data)}
+
+
+def summarize_array(data):
+    '''summarize numpy like arrays by shape, dtype and size in bytes'''
+    return {'type': type(data).__name__,
+            'shape': tuple(data.shape),
+            'dtype': str(data.dtype),
+            'nbytes': getattr(data, 'nbytes', None)}
+
+
+def summarize_type(data):
+    '''summarize unknown data by type only, never iterating or measuring it'''
+    return {'type': type(data).__name__}
+
+
+# built-in summarizers keyed by type, resolved along the mro of the summarized type
+SUMMARIZERS = {
+    type(None): summarize_value,
+    bool: summarize_value,
+    int: summarize_value,
+    float: summarize_value,
+    complex: summarize_value,
+    str: summarize_length,
+    bytes: summarize_length,
+    bytearray: summarize_length,
+    memoryview: summarize_length,
+    list: summarize_length,
+    tuple: summarize_length,
+    dict: summarize_length,
+    set: summarize_length,
+    frozenset: summarize_length,
+    range: summarize_length,
+    deque: summarize_length,
+}
+
+
+class Deferred:
+    '''reference to call data which is summarized when the report is read'''
+    __slots__ = ('summarize', 'data')
+
+    def __init__(self, summarize, data):
+        self.summarize = summarize
+        self.data = data
+
+    def resolve(self):
+        '''summarize the referenced data'''
+        return self.summarize(self.data)
+
+
+class Counted:
+    '''generator proxy counting the items produced, `yield from` forwards send, throw and close through it'''
+    __slots__ = ('gen', 'start_time', 'first', 'items')
+
+    def __init__(self, gen, start_time):
+        self.gen = gen
+        self.start_time = start_time
+        self.first = None  # seconds to the first item
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.count(self.gen.send(None))
+
+    def send(self, value):
+        return self.count(self.gen.send(value))
+
+    def throw(self, *args):
+        return self.count(self.gen.throw(*args))
+
+    def close(self):
+        self.gen.close()
+
+    def count(self, item):
+        '''count an item produced by the generator'''
+        if self.first is None:
+            self.first = time.perf_counter() - self.start_time
+        self.items += 1
+        return item
+
+
+class Sketch:
+    '''mergeable quantile sketch with bounded relative error (log bucketed histogram)'''
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.pos = {}  # bucket index -> count for positive values
+        self.neg = {}  # bucket index -> count for negative values
+        self.zero = 0
+        self.count = 0
+
+    def _index(self, value):
+        '''bucket index of an absolute value'''
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, index):
+        '''representative value of a bucket index'''
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value):
+        '''add a value to the sketch'''
+        if value > 0:
+            index = self._index(value)
+            self.pos[index] = self.pos.get(index, 0) + 1
+        elif value < 0:
+            index = self._index(-value)
+            self.neg[index] = self.neg.get(index, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+
+    def merge(self, other):
+        '''merge another sketch of the same accuracy into this one'''
+        if other.accuracy != self.accuracy:
+            raise ValueError('cannot merge sketches with different accuracy')
+        for index, count in other.pos.items():
+            self.pos[index] = self.pos.get(index, 0) + count
+        for index, count in other.neg.items():
+            self.neg[index] = self.neg.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        '''estimate the value at quantile q (0 <= q <= 1)'''
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+
+        # walk buckets from the most negative to the most positive value
+        for index in sorted(self.neg, reverse=True):
+            seen += self.neg[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.pos):
+            seen += self.pos[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.pos)) if self.pos else 0.0
+
+
+class Stats:
+    '''running count / min / max / mean / variance and quantiles of one metric'''
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.sketch = Sketch()
+
+    def add(self, value):
+        '''add a value using welford's online algorithm'''
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    def merge(self, other):
+        '''merge another stats object into this one'''
+        if not other.count:
+            return self
+        if not self.count:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+        # combine moments with chan's parallel algorithm
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def variance(self):
+        '''sample variance'''
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        '''sample standard deviation'''
+        return math.sqrt(self.variance)
+
+    def quantile(self, q):
+        '''estimate the value at quantile q'''
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        '''summarize stats as a dictionary'''
+        return {'count': self.count,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean,
+                'stdev': self.stdev,
+                'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99)}
+
+
+class Aggregate:
+    '''streaming report of a single function with an optional ring buffer of calls'''
+    def __init__(self, buffer=None):
+        self.calls = 0
+        self.metrics = {}  # metric name -> Stats
+        self.lines = {}  # source line -> total bytes allocated
+        self.samples = deque(maxlen=buffer) if buffer else None
+        self.lock = threading.Lock()  # held while adding, readers merge a consistent state
+
+    def add(self, sample):
+        '''aggregate the numeric metrics of a call record'''
+        with self.lock:
+            self.calls += 1
+            for key in METRICS:
+                value = sample.get(key)
+                if value is None:
+                    continue
+                if key not in self.metrics:
+                    self.metrics[key] = Stats()
+                self.metrics[key].add(value)
+            for line, size in sample.get('lines') or ():
+                self.lines[line] = self.lines.get(line, 0) + size
+            if self.samples is not None:
+                self.samples.append(sample)
+
+    def merge(self, other):
+        '''merge another aggregate into this one, the other may be added to by another thread'''
+        with other.lock:
+            self.calls += other.calls
+            for key, stats in other.metrics.items():
+                if key not in self.metrics:
+                    self.metrics[key] = Stats()
+                self.metrics[key].merge(stats)
+            for line, size in other.lines.items():
+                self.lines[line] = self.lines.get(line, 0) + size
+            if other.samples is not None:
+                if self.samples is None:
+                    self.samples = deque(maxlen=other.samples.maxlen)
+                self.samples.extend(other.samples)
+        return self
+
+    def __getitem__(self, metric):
+        return self.metrics[metric]
+
+    def summary(self):
+        '''summarize the aggregate as a dictionary'''
+        summary = {'calls': self.calls}
+        summary.update({key: stats.summary() for key, stats in self.metrics.items()})
+        if self.lines:
+            summary['lines'] = self.top_lines()
+        return summary
+
+    def top_lines(self, top=10):
+        '''source lines with the most bytes allocated'''
+        return sorted(self.lines.items(), key=lambda line: line[1], reverse=True)[:top]
+
+    def __repr__(self):
+        return repr(self.summary())
+
+
+def to_columns(samples):
+    '''convert call records to {metric: array} columns'''
+    # missing values are stored as nan to keep the columns aligned
+    return {metric: array('d', (math.nan if sample.get(metric) is None else sample[metric] for sample in samples))
+            for metric in METRICS if any(sample.get(metric) is not None for sample in samples)}
+
+
+def write(file, name, samples):
+    '''append the metric columns of call records to an open binary file'''
+    write_columns(file, name, to_columns(samples))
+
+
+def write_columns(file, name, columns):
+    '''append {metric: values} columns of a function to an open binary file'''
+    encoded = name.encode()
+    for metric, values in columns.items():
+        column = array('d', values)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        key = metric.encode()
+        header = CHUNK.pack(MAGIC, len(encoded), len(key), len(column)) + encoded + key
+
+        # pad the header so the column is 8 byte aligned in a memory map
+        header += b'\0' * (-(file.tell() + len(header)) % 8)
+        file.write(header)
+        file.write(column.tobytes())
+
+
+def read(path):
+    '''iterate the columns of an exported file as (function, metric, values)
+
+    values are zero copy memoryviews of a memory map on little endian machines
+    '''
+    import mmap
+
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        magic, name_size, key_size, count = CHUNK.unpack_from(data, offset)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a benchy export, bad chunk at byte {offset}')
+        offset += CHUNK.size
+        name = bytes(view[offset:offset + name_size]).decode()
+        offset += name_size
+        metric = bytes(view[offset:offset + key_size]).decode()
+        offset += key_size + (-offset - key_size) % 8
+        values = view[offset:offset + count * 8].cast('d')
+        if sys.byteorder == 'big':
+            values = array('d', values.tobytes())
+            values.byteswap()
+        offset += count * 8
+        yield name, metric, values
+
+
+def files(*paths):
+    '''expand export folders and glob patterns into file paths'''
+    import glob
+
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, '*.benchy'))))
+        else:
+            found.extend(sorted(glob.glob(path)) or [path])
+    return found
+
+
+def load(*paths):
+    '''combine the columns of exported files
+
+    :param paths: export files, folders or glob patterns
+    :return: {function: {metric: array}}
+    '''
+    report = {}
+    for path in files(*paths):
+        for name, metric, values in read(path):
+            report.setdefault(name, {}).setdefault(metric, array('d')).frombytes(values.tobytes())
+    return report
+
+
+def merge(*paths):
+    '''aggregate exported files of many processes or nodes into one streaming report
+
+    :param paths: export files, folders or glob patterns
+    :return: {function: Aggregate}
+    '''
+    report = {}
+    for path in files(*paths):
+        for name, metric, values in read(path):
+            agg = report.setdefault(name, Aggregate())
+            if metric not in agg.metrics:
+                agg.metrics[metric] = Stats()
+            stats = agg.metrics[metric]
+            for value in values:
+                if value == value:  # skip nan
+                    stats.add(value)
+            if metric == 'benchmark':
+                agg.calls += len(values)
+    return report
+
+
+def columns_of(source):
+    '''collect {function: {metric: values}} columns of a report source
+
+    :param source: export file, folder or glob pattern, a Benchy instance or a columns dictionary
+    '''
+    if isinstance(source, str):
+        return load(source)
+    if isinstance(source, Benchy):
+        return source.columns()
+    return source
+
+
+def save_baseline(name, source, folder='baselines'):
+    '''save the columns of a report source as a named baseline
+
+    :param name: name of the baseline
+    :param source: export file, folder or glob pattern, a Benchy instance or a columns dictionary
+    :param folder: folder to store baselines in
+    :return: path of the baseline file
+    '''
+    os.makedirs(folder, exist_ok=True)
+    filepath = os.path.join(folder, f'{name}.benchy')
+    columns = columns_of(source)
+    with open(filepath, 'wb') as file:
+        for func_name, metrics in columns.items():
+            write_columns(file, func_name, metrics)
+    return filepath
+
+
+def mann_whitney(x, y):
+    '''two sided p value of the mann whitney u test (normal approximation with tie correction)'''
+    n1, n2 = len(x), len(y)
+    n = n1 + n2
+    combined = sorted([(value, 0) for value in x] + [(value, 1) for value in y])
+
+    # rank the combined values, ties share their average rank
+    rank_sum, ties, i = 0.0, 0.0, 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 0)
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if not sigma:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / sigma
+    return min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
+
+
+def bootstrap_ratio(base, current, confidence=0.95, resamples=1000, seed=0):
+    '''bootstrapped confidence interval of the ratio of medians current / base'''
+    import random, statistics
+
+    rng = random.Random(seed)
+    ratios = []
+    for _ in range(resamples):
+        base_median = statistics.median(rng.choices(base, k=len(base)))
+        current_median = statistics.median(rng.choices(current, k=len(current)))
+        if base_median:
+            ratios.append(current_median / base_median)
+    if not ratios:
+        return None, None
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    return ratios[int(tail * (len(ratios) - 1))], ratios[int((1 - tail) * (len(ratios) - 1))]
+
+
+def compare(baseline, current, metric='benchmark', threshold=0.05, alpha=0.05,
+            resamples=1000, max_samples=1000, seed=0):
+    '''compare a report against a baseline per function
+
+    a function regressed when its median grew by more than the threshold
+    and the mann whitney u test rejects equal distributions at alpha
+
+    :param baseline: export file, folder or glob pattern, a Benchy instance or a columns dictionary
+    :param current: report source to compare, same types as baseline
+    :param metric: the metric to compare
+    :param threshold: relative change of the median to tolerate, 0.05 = 5%
+    :param alpha: significance level of the test and 1 - confidence of the interval
+    :param resamples: number of bootstrap resamples
+    :param max_samples: values per function to draw for the statistics
+    :param seed: random seed, results are reproducible for a given seed
+    :return: list of row dictionaries, one per function
+    '''
+    import random, statistics
+
+    base_columns, current_columns = columns_of(baseline), columns_of(current)
+    rng = random.Random(seed)
+    rows = []
+    for name in sorted(set(base_columns) | set(current_columns)):
+        base = [v for v in base_columns.get(name, {}).get(metric, ()) if v == v]
+        cur = [v for v in current_columns.get(name, {}).get(metric, ()) if v == v]
+        row = {'function': name,
+               'baseline': statistics.median(base) if base else None,
+               'current': statistics.median(cur) if cur else None,
+               'ratio': None, 'low': None, 'high': None, 'p': None}
+        if not base or not cur:
+            row['status'] = 'new' if cur else 'missing'
+            rows.append(row)
+            continue
+
+        # bound the cost of the statistics for large reports
+        if len(base) > max_samples:
+            base = rng.sample(base, max_samples)
+        if len(cur) > max_samples:
+            cur = rng.sample(cur, max_samples)
+
+        row['ratio'] = row['current'] / row['baseline'] if row['baseline'] else None
+        row['low'], row['high'] = bootstrap_ratio(base, cur, 1 - alpha, resamples, seed)
+        row['p'] = mann_whitney(base, cur) if len(base) > 1 or len(cur) > 1 else 1.0
+
+        if row['ratio'] is not None and row['p'] < alpha and row['ratio'] > 1 + threshold:
+            row['status'] = 'slower'
+        elif row['ratio'] is not None and row['p'] < alpha and row['ratio'] < 1 / (1 + threshold):
+            row['status'] = 'faster'
+        else:
+            row['status'] = 'same'
+        rows.append(row)
+    return rows
+
+
+def table(rows):
+    '''format comparison rows as a text table'''
+    def number(value, fmt):
+        return '-' if value is None else format(value, fmt)
+
+    lines = [('function', 'baseline', 'current', 'change', 'ci', 'p', 'status')]
+    for row in rows:
+        change = '-' if row['ratio'] is None else f"{(row['ratio'] - 1) * 100:+.1f}%"
+        ci = '-' if row['low'] is None else f"{row['low']:.3f}-{row['high']:.3f}"
+        lines.append((row['function'], number(row['baseline'], '.3g'), number(row['current'], '.3g'),
+                      change, ci, number(row['p'], '.3g'), row['status']))
+    widths = [max(len(line[i]) for line in lines) for i in range(len(lines[0]))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in lines)
+
+
+def regressions(rows):
+    '''rows of functions which got slower'''
+    return [row for row in rows if row['status'] == 'slower']
+
+
+def assert_no_regression(baseline, current, **kwargs):
+    '''raise an AssertionError listing the comparison when any function regressed, for use in tests'''
+    rows = compare(baseline, current, **kwargs)
+    if regressions(rows):
+        raise AssertionError(f'benchmark regression\n{table(rows)}')
+    return rows
+
 
 class Benchy:
     '''decorator class for collecting benchmark reports'''
-    def __init__(self):
+    def __init__(self, stream=False, buffer=None, sample=1, interval=None, enabled=True, lazy=False,
+                 memory=False, top=0, cpu=False, export=None, flush_every=10000):
+        self._local = threading.local()  # per thread report buffer
+        self._lock = threading.Lock()  # held while buffers are registered, folded or read
+        self.report = {}  # (thread, buffer) of every live thread and the buffer of finished ones
+        self.stream = stream  # aggregate calls instead of storing every call record
+        self.buffer = buffer  # size of the per function ring buffer of call records in stream mode
+        self.sample = sample  # benchmark 1 in every n calls
+        self.interval = interval  # benchmark at most one call per interval in seconds
+        self.enabled = enabled  # global switch, disabled wrappers only forward the call
+        self.lazy = lazy  # keep references to call data and summarize when the report is read
+        self.memory = memory  # record peak and net allocated bytes per call with tracemalloc
+        self.top = top  # number of top allocating source lines to record per call in memory mode
+        self.cpu = cpu  # record process cpu time, thread cpu time and gc pauses per call
+        self.export = export  # folder to flush call records to, one file per process
+        self.flush_every = flush_every  # flush a function once it holds this many records in export mode
+        self._flush_lock = threading.Lock()
+        if stream and export:
+            raise ValueError('stream mode aggregates cannot be exported, export call records with stream=False')
+
+        # flush remaining records at exit and drop records inherited by forked workers
+        instances.add(self)
+        self.summarizers = dict(SUMMARIZERS)  # type -> summarizer
+        self._resolved = {}  # cache of summarizers resolved for concrete types
+
+    @property
+    def report(self):
+        '''merge the report buffers of all threads'''
+        report = {}
+        with self._lock:
+            self._retire()
+            for _, buffer in self._buffers:
+                self._fold(report, buffer)
+
+        # summarize deferred call data of the collected records
+        for samples in report.values():
+            if isinstance(samples, Aggregate):
+                samples = samples.samples or ()
+            for sample in samples:
+                self.resolve(sample)
+        return report
+
+    @report.setter
+    def report(self, report):
+        '''replace the report, i.e. `benchy.report = {}` clears it'''
+        self._local = threading.local()
+        self._retired = dict(report)  # records of finished threads
+        self._buffers = [(None, self._retired)]
+
+    def _fold(self, report, buffer):
+        '''merge the records of a buffer into a report'''
+        for name, samples in list(buffer.items()):
+            if isinstance(samples, Aggregate):
+                if name not in report:
+                    report[name] = Aggregate(self.buffer)
+                report[name].merge(samples)
+            elif samples:
+                report.setdefault(name, []).extend(samples)
+
+    def _retire(self):
+        '''fold the buffers of finished threads into the shared buffer, called holding the lock
+
+        keeps one buffer per live thread for thread per request servers
+        '''
+        buffers = []
+        for thread, buffer in self._buffers:
+            if thread is None or thread.is_alive():
+                buffers.append((thread, buffer))
+            else:
+                self._fold(self._retired, buffer)
+        self._buffers = buffers
+
+    def _exit(self):
+        '''flush remaining records at interpreter exit'''
+        if self.export:
+            self.flush()
+
+    def _forked(self):
+        '''clear records copied from the parent process, the parent flushes them'''
+        self._lock = threading.Lock()
         self.report = {}
+        self._flush_lock = threading.Lock()
 
-    @staticmethod
-    def summarize(data):
-        '''summarize iterable data'''
-        if hasattr(data, '__iter__'):
-            return {'type': type(data).__name__, 'length': len(data)}
+        # pool workers exit without running atexit handlers, their finalizers flush the records
+        util = sys.modules.get('multiprocessing.util')
+        if util is not None:
+            util.register_after_fork(self, finalize_weak)
+
+    def flush(self, path=None):
+        '''append the numeric columns of all call records to the file of this process
+
+        records are removed from the report once written, stream mode cannot be exported
+
+        :param path: folder to write to, defaults to the export folder
+        :return: path of the written file
+        '''
+        import socket
+
+        folder = path or self.export
+        if not folder:
+            raise ValueError('flush needs a path or an export folder')
+        if self.stream:
+            raise ValueError('stream mode aggregates cannot be exported, export call records with stream=False')
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, f'{socket.gethostname()}-{os.getpid()}.benchy')
+
+        with self._flush_lock, self._lock, open(filepath, 'ab') as file:
+            for _, buffer in self._buffers:
+                for name, samples in list(buffer.items()):
+                    if isinstance(samples, Aggregate):
+                        continue
+
+                    # only take the records present now, the owning thread may keep appending
+                    count = len(samples)
+                    if not count:
+                        continue
+                    write(file, name, samples[:count])
+                    del samples[:count]
+        return filepath
+
+    def columns(self):
+        '''numeric metric columns of the current call records, {function: {metric: array}}'''
+        columns = {}
+        for name, samples in self.report.items():
+            if isinstance(samples, Aggregate):
+                samples = list(samples.samples or ())
+            columns[name] = to_columns(samples)
+        return columns
+
+    def _thread_buffer(self):
+        '''report buffer and name of the calling thread'''
+        local = self._local
+        try:
+            return local.buffer, local.thread
+        except AttributeError:
+            # first sample of this thread, register a new buffer
+            thread = threading.current_thread()
+            local.buffer, local.thread = {}, thread.name
+            with self._lock:
+                self._retire()
+                self._buffers.append((thread, local.buffer))
+            return local.buffer, local.thread
+
+    def add_summarizer(self, dtype, summarizer):
+        '''register a summarizer for a type and its subclasses
+
+        :param dtype: the type to summarize
+        :param summarizer: function taking the data and returning a summary dictionary
+        '''
+        self.summarizers[dtype] = summarizer
+        self._resolved = {}
+
+    def summarize(self, data):
+        '''summarize data with the summarizer registered for its type'''
+        dtype = type(data)
+        try:
+            summarizer = self._resolved[dtype]
+        except KeyError:
+            summarizer = self._resolve_summarizer(dtype)
+        return summarizer(data)
+
+    def _resolve_summarizer(self, dtype):
+        '''find the summarizer of the closest registered base class'''
+        for base in dtype.__mro__:
+            if base in self.summarizers:
+                summarizer = self.summarizers[base]
+                break
         else:
-            return {'type': type(data).__name__, 'value': data}
+            # duck type numpy like arrays without importing numpy
+            if hasattr(dtype, 'shape') and hasattr(dtype, 'dtype'):
+                summarizer = summarize_array
+            else:
+                summarizer = summarize_type
+        self._resolved[dtype] = summarizer
+        return summarizer
 
     def func_meta(self, data):
         '''collect args / kwargs meta info & summarize inputs'''
@@ -22,34 +806,233 @@ class Benchy:
         else:
             return [self.summarize(arg) for arg in data]
 
+    def describe(self, sample, args, kwargs, result, summary=None):
+        '''add args, kwargs and result summaries to a call sample'''
+        if self.lazy:
+            sample['args'] = Deferred(self.func_meta, args)
+            sample['kwargs'] = Deferred(self.func_meta, kwargs)
+            sample['result'] = summary or Deferred(self.summarize, result)
+        else:
+            sample['args'] = self.func_meta(args)
+            sample['kwargs'] = self.func_meta(kwargs)
+            sample['result'] = summary or self.summarize(result)
+
+    @staticmethod
+    def resolve(sample):
+        '''summarize the deferred call data of a sample in place'''
+        for key in ('args', 'kwargs', 'result'):
+            value = sample.get(key)
+            if isinstance(value, Deferred):
+                sample[key] = value.resolve()
+
+    def record(self, name, sample, args, kwargs, result, summary=None):
+        '''store a call sample in the report buffer of the calling thread'''
+        report, thread = self._thread_buffer()
+
+        if self.stream:
+            # check if aggregate exists for func
+            if name not in report:
+                report[name] = Aggregate(self.buffer)
+
+            # only summarize call info when a ring buffer is kept
+            if self.buffer:
+                sample['thread'] = thread
+                self.describe(sample, args, kwargs, result, summary)
+            report[name].add(sample)
+            return
+
+        # check if report exists for func
+        if name not in report:
+            report[name] = []
+
+        # collect thread, args, kwargs, results summaries
+        sample['thread'] = thread
+        self.describe(sample, args, kwargs, result, summary)
+        report[name].append(sample)
+
+        # bound the records kept in memory when exporting
+        if self.export and len(report[name]) >= self.flush_every:
+            self.flush()
+
     def __call__(self, func):
         '''benchmark and store report for called function'''
 
         # collect original function if already wrapped
         original_func = getattr(func, "__wrapped__", func)
+        name = original_func.__name__
+        mode = meta_handler.func_mode(original_func)
 
-        def wrapper(*args, **kwargs):
+        calls = itertools.count()  # call counter for 1 in n sampling
+        due = [0.0]  # next perf counter time a call is due for time based sampling
 
-            # benchmark the function
-            start_time = time.perf_counter()
-            result = original_func(*args, **kwargs)
-            end_time = time.perf_counter()
-            elapsed_time = end_time - start_time
+        def skip():
+            '''check if a call falls outside of the sample'''
+            if self.sample > 1 and next(calls) % self.sample:
+                return True
+            if self.interval:
+                now = time.perf_counter()
+                if now < due[0]:
+                    return True
+                due[0] = now + self.interval
+            return False
 
-            # check if report exists for func
-            if original_func.__name__ not in self.report:
-                self.report[original_func.__name__] = []
+        if mode == 'coroutine':
+            async def wrapper(*args, **kwargs):
+                if not self.enabled or skip():
+                    return await original_func(*args, **kwargs)
 
-            # collect benchmark, args, kwargs, results summaries
-            self.report[original_func.__name__].append({
-                'benchmark': elapsed_time,
-                'args': self.func_meta(args),
-                'kwargs': self.func_meta(kwargs),
-                'result': self.summarize(result)
-            })
+                # benchmark the coroutine until completion
+                probe = self._begin() if self.memory or self.cpu else None
+                start_time = time.perf_counter()
+                result = await original_func(*args, **kwargs)
+                elapsed_time = time.perf_counter() - start_time
 
-            return result
+                sample = {'benchmark': elapsed_time, 'task': task_name()}
+                if probe is not None:
+                    self._end(probe, sample)
+                self.record(name, sample, args, kwargs, result)
+                return result
+
+        elif mode == 'asyncgen':
+            async def wrapper(*args, **kwargs):
+                timed = self.enabled and not skip()
+
+                # benchmark the async generator until exhausted or closed
+                if timed:
+                    probe = self._begin() if self.memory or self.cpu else None
+                    start_time = time.perf_counter()
+                first, items = None, 0
+                agen = original_func(*args, **kwargs)
+                try:
+                    try:
+                        item = await agen.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    # re-yield items forwarding asend, athrow and aclose to the generator
+                    while True:
+                        if timed and first is None:
+                            first = time.perf_counter() - start_time
+                        items += 1
+                        try:
+                            sent = yield item
+                        except GeneratorExit:
+                            await agen.aclose()
+                            raise
+                        except BaseException as error:
+                            try:
+                                item = await agen.athrow(error)
+                            except StopAsyncIteration:
+                                return
+                        else:
+                            try:
+                                item = await agen.asend(sent)
+                            except StopAsyncIteration:
+                                return
+                finally:
+                    if timed:
+                        elapsed_time = time.perf_counter() - start_time
+                        sample = self._stream_sample(elapsed_time, first, items)
+                        sample['task'] = task_name()
+                        if probe is not None:
+                            self._end(probe, sample)
+                        self.record(name, sample, args, kwargs, agen, {'type': type(agen).__name__, 'length': items})
+
+        elif mode == 'generator':
+            def wrapper(*args, **kwargs):
+                if not self.enabled or skip():
+                    return (yield from original_func(*args, **kwargs))
+
+                # benchmark the generator until exhausted or closed
+                probe = self._begin() if self.memory or self.cpu else None
+                start_time = time.perf_counter()
+                gen = original_func(*args, **kwargs)
+                counted = Counted(gen, start_time)
+                try:
+                    return (yield from counted)
+                finally:
+                    elapsed_time = time.perf_counter() - start_time
+                    sample = self._stream_sample(elapsed_time, counted.first, counted.items)
+                    if probe is not None:
+                        self._end(probe, sample)
+                    self.record(name, sample, args, kwargs, gen,
+                                {'type': type(gen).__name__, 'length': counted.items})
+
+        else:
+            def wrapper(*args, **kwargs):
+
+                # fast path when benchmarking is disabled
+                if not self.enabled:
+                    return original_func(*args, **kwargs)
+
+                # skip calls outside of the sample
+                if (self.sample > 1 or self.interval) and skip():
+                    return original_func(*args, **kwargs)
+
+                # benchmark the function
+                probe = self._begin() if self.memory or self.cpu else None
+                start_time = time.perf_counter()
+                result = original_func(*args, **kwargs)
+                end_time = time.perf_counter()
+                elapsed_time = end_time - start_time
+
+                sample = {'benchmark': elapsed_time}
+                if probe is not None:
+                    self._end(probe, sample)
+                self.record(name, sample, args, kwargs, result)
+                return result
 
         # re-wrap original function
         wrapper.__wrapped__ = original_func
-        return wrapper
\ No newline at end of file
+        return wrapper
+
+    def _begin(self):
+        '''collect the probe state before a benchmarked call'''
+        probe = {}
+        if self.memory:
+            # tracing is started on first use and left running for later calls
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self.top:
+                probe['snapshot'] = tracemalloc.take_snapshot()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            probe['memory'] = tracemalloc.get_traced_memory()[0]
+        if self.cpu:
+            # the gc callback is installed on first use and left installed for later calls
+            if gc_callback not in gc.callbacks:
+                gc.callbacks.append(gc_callback)
+            probe['gc'] = getattr(gc_time, 'total', 0.0)
+            probe['thread_cpu'] = time.thread_time()
+            probe['cpu'] = time.process_time()
+        return probe
+
+    def _end(self, probe, sample):
+        '''add the probed metrics of a benchmarked call to its sample'''
+        if 'memory' in probe:
+            current, peak = tracemalloc.get_traced_memory()
+            # peak can only be isolated per call where the peak can be reset (python 3.9+)
+            if hasattr(tracemalloc, 'reset_peak'):
+                sample['peak'] = max(peak - probe['memory'], 0)
+            sample['net'] = current - probe['memory']
+            if 'snapshot' in probe:
+                sample['lines'] = self._top_lines(probe['snapshot'])
+        if 'cpu' in probe:
+            sample['cpu'] = time.process_time() - probe['cpu']
+            sample['thread_cpu'] = time.thread_time() - probe['thread_cpu']
+            sample['gc'] = getattr(gc_time, 'total', 0.0) - probe['gc']
+
+    def _top_lines(self, snapshot):
+        '''source lines allocating the most bytes since a snapshot'''
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(snapshot.filter_traces(ignore), 'lineno')
+        lines = [(f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', stat.size_diff)
+                 for stat in stats if stat.size_diff > 0]
+        return lines[:self.top]
+
+    @staticmethod
+    def _stream_sample(elapsed_time, first, items):
+        '''build the sample of a streaming producer'''
+        return {'benchmark': elapsed_time,
+                'first': first,
+                'items': items,
+                'throughput': items / elapsed_time if elapsed_time else None}
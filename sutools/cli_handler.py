@@ -1,19 +1,51 @@
-import inspect, os, argparse, logging, sys, asyncio
+import os, argparse, logging, sys, time, json, threading
+from sutools import meta_handler
 
 
 class CLI:
     """object designed for swift module CLI configuration"""
 
-    def __init__(self, desc, logs, log_obj=None):
-        """init top-level parser"""
+    def __init__(self, desc, logs, log_obj=None, cache=False, loop_factory=None):
+        """init top-level parser
+
+        :param cache: cache command specifications on disk, True for the user cache folder or a folder path
+        :param loop_factory: callable creating the event loops of async commands, i.e. uvloop.new_event_loop
+        """
 
         # define the name of the cli application as the file name of the module which is importing this class
-        self.name = os.path.basename(inspect.stack()[-1].filename)[:-3]
+        self.name = meta_handler.prog_name()
         # define root parser
         self.parser = argparse.ArgumentParser(prog=self.name, description=desc)
+        # options of the cli use private dests, command parameters of the same name would overwrite them
+        self.parser.add_argument("--serve", dest="_su_serve", metavar="SOCKET",
+                                 help="keep the module resident and serve commands on a unix socket")
+        self.parser.add_argument("--jsonl", dest="_su_jsonl", action="store_true",
+                                 help="print results as json lines, one per item of lists and iterators")
+        self.parser.add_argument("--batch", dest="_su_batch", metavar="FILE",
+                                 help="run the command lines of a file, - for stdin, one per line as text or json")
+        self.parser.add_argument("--map", dest="_su_map", choices=("thread", "process", "async"),
+                                 help="call a variadic command once per positional argument in a pool")
+        self.parser.add_argument("--workers", dest="_su_workers", type=int, default=None, metavar="N",
+                                 help="workers of the batch or map pool, default: 1 for batches, per pool for maps")
+        self.parser.add_argument("--chunksize", dest="_su_chunksize", type=int, default=1, metavar="N",
+                                 help="arguments sent to a map process worker at once, default: 1")
+        self.parser.add_argument("--pool", dest="_su_pool", choices=("thread", "process", "async"), default="thread",
+                                 help="pool of the batch workers, async runs N commands concurrently on the event loop, default: thread")
+        self.parser.add_argument("--unordered", dest="_su_unordered", action="store_true",
+                                 help="print batch results as they complete instead of in input order")
         # add commands subparser
         self.subparsers = self.parser.add_subparsers(title="commands", dest="command")
         self.func_dict = {}  # init empty func dict
+        self.built = set()  # names of the commands with a built subparser
+        self.specs = {}  # command name -> specification
+        self.cache = None
+        if cache:
+            path = meta_handler.prog_path()
+            if os.path.isfile(path):
+                self.cache = SpecCache(path, None if cache is True else cache)
+        self.loop_factory = loop_factory
+        self.loops = threading.local()  # long lived event loop per thread
+        self.all_loops = []  # every loop created, to close them
         self.log_obj = log_obj  # store copy of the log object for logging compatibility
         self.input = None
 
@@ -28,153 +60,1057 @@ class CLI:
                 )  # sets logs to 1 above critical i.e. 51
 
     def add_funcs(self, func_dict):
-        """add registered functions to the cli"""
+        """add registered functions to the cli
+
+        subparsers are built on demand by parse, only for the invoked command
+        """
 
         self.func_dict = func_dict  # assign function dictionary property
+        self.built = set()  # names of the commands with a built subparser
 
-        # iterate through registered functions
-        for func_name, items in func_dict.items():
-            names = items['names']  # collect arg names
-            types = items['types']  # collect types of arg
-            arg_types = [types.get(name, None) for name in names]
-            defaults = items['defaults']  # collect default args
-
-            # init arg help and arg description
-            ahelp = f"execute {func_name} function"
-
-            # collect command description
-            signature = inspect.signature(func_dict[func_name]['func'])
-
-            # collect names and params for a given function
-            params = []
-            for name, param in signature.parameters.items():
-                
-                # check if function contains annotations
-                if param.annotation != inspect.Parameter.empty:
-                    # if default arg exists display in docs
-                    if param.default != inspect.Parameter.empty:
-                        params.append(
-                            f"{name}: {param.annotation.__name__} = {param.default!r}"
-                        )
-                    else:
-                        params.append(f"{name}: {param.annotation.__name__}")
-                else:
-                    if param.default != inspect.Parameter.empty:
-                        params.append(f"{name} = {param.default!r}")
-                    else:
-                        params.append(f"{name}")
+        # cached specifications are only valid for the module source they were built from
+        # and for the source file of each function, which may be an imported module
+        if self.cache:
+            cached = self.cache.load()
+            stats = {}  # source file -> [path, mtime, size]
+            self.specs = {}
+            for name, items in func_dict.items():
+                source = self.cache.source(items.func, stats)
+                spec = cached.get(name)
+                if not spec or spec.get("source") != source:
+                    spec = dict(command_spec(name, items), source=source)
+                self.specs[name] = spec
+            if self.specs != cached:
+                self.cache.save(self.specs)
+
+    def build_all(self):
+        """build the subparsers of every command, i.e. for the top-level help"""
+        for func_name in self.func_dict:
+            self.build(func_name)
 
-            # define return type if exists for docs
-            if "return" in types:
-                adesc = f"{func_dict[func_name]['func'].__name__}({', '.join(params)}) -> {str(types['return'].__name__)}"
+        # add the bench command after the registered commands
+        self.add_bench()
+
+    def build(self, func_name):
+        """build the subparser of a registered command from its specification"""
+        if func_name in self.built:
+            return
+        self.built.add(func_name)
+        items = self.func_dict[func_name]
+        spec = self.spec(func_name)
+        from sutools import type_handler
+
+        converters = type_handler.converters(items)  # compile converters of arg types
+        defaults = items.defaults  # collect default args
+
+        # init sub parser
+        subp = self.subparsers.add_parser(
+            func_name,
+            help=spec['help'],
+            description=spec['description'],
+            argument_default=argparse.SUPPRESS,
+            add_help=False,
+        )
+
+        for arg in spec['arguments']:
+            name = arg['name']
+            atype = converters.get(name, None)
+
+            if arg['flags'][0].startswith('-'):
+                # if there exists a short name with the same first and
+                # last chars do not define one
+                try:
+                    subp.add_argument(
+                        *arg['flags'],
+                        metavar=arg['metavar'],
+                        type=atype,
+                        default=defaults[name],
+                        help=arg['help'],
+                    )
+                except argparse.ArgumentError:
+                    subp.add_argument(
+                        arg['flags'][-1],
+                        metavar=arg['metavar'],
+                        type=atype,
+                        default=defaults[name],
+                        help=arg['help'],
+                    )
+            elif arg['nargs']:
+                # if variadic allow any number of args
+                subp.add_argument(name, nargs=arg['nargs'], type=atype, help=arg['help'])
             else:
-                adesc = f"{func_dict[func_name]['func'].__name__}({', '.join(params)})"
-
-            # define help string
-            if items['desc'] is not None:
-                ahelp = items['desc']
-
-            # init sub parser
-            subp = self.subparsers.add_parser(
-                func_name,
-                help=ahelp,
-                description=adesc,
-                argument_default=argparse.SUPPRESS,
-                add_help=False,
-            )
+                subp.add_argument(name, type=atype, help=arg['help'])
 
-            # create abbreviations for named short name
-            abbrevs = set()
-            for name, atype in zip(names, arg_types):
-                # if arg is contains a default define a short name
-                if name in defaults:
-                    # default abbreviation is the first 2 characters
-                    short_name = name[:2]
-                    # if space is taken define short name as just the list character
-                    if short_name in abbrevs:
-                        short_name = name[-1]
-                    abbrevs.add(short_name)
-
-                    # if there exists a short name with the same first and 
-                    # last chars do not define one
-                    try:
-                        subp.add_argument(
-                            f"-{short_name}",
-                            f"--{name}",
-                            metavar=str(atype) if atype is not None else None,
-                            type=atype,
-                            default=defaults[name],
-                            help=f"default: {defaults[name]}",
-                        )
-                    except argparse.ArgumentError:
-                        subp.add_argument(
-                            f"--{name}",
-                            metavar=str(atype) if atype is not None else None,
-                            type=atype,
-                            default=defaults[name],
-                            help=f"default: {defaults[name]}",
-                        )
-                else:
-                    # if variadic allow any number of args
-                    if items['variadic']:
-                        subp.add_argument(
-                            name, nargs='*', type=atype, help=str(atype) if atype is not None else None
-                        )
+        # overide help & place at end of options
+        subp.add_argument(
+            "-h", "--help", action="help", help="Show this help message and exit."
+        )
+
+    def spec(self, func_name):
+        """specification of a command, from the cache when it is valid"""
+        if func_name not in self.specs:
+            self.specs[func_name] = command_spec(func_name, self.func_dict[func_name])
+            if self.cache:
+                self.cache.save(self.specs)
+        return self.specs[func_name]
+
+    def add_bench(self):
+        """add the bench command for benchmarking registered commands"""
+
+        # a registered function named bench takes precedence
+        if "bench" in self.func_dict or "bench" in self.built:
+            return
+        self.built.add("bench")
+
+        subp = self.subparsers.add_parser(
+            "bench",
+            help="benchmark a command",
+            description="run a command repeatedly and report its timing, options must precede the command",
+            add_help=False,
+        )
+        subp.add_argument("-n", "--number", type=int, default=None, metavar="<class 'int'>",
+                          help="calls per repetition, default: calibrated to take at least 0.2 seconds")
+        subp.add_argument("-r", "--repeat", type=int, default=5, metavar="<class 'int'>",
+                          help="default: 5")
+        subp.add_argument("-w", "--warmup", type=int, default=1, metavar="<class 'int'>",
+                          help="default: 1")
+        subp.add_argument("-p", "--procs", type=int, default=None, metavar="<class 'int'>",
+                          help="also run the repetitions in a pool of processes to check scaling")
+        subp.add_argument("target", choices=list(self.func_dict), metavar="command",
+                          help="the command to benchmark")
+        subp.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the command")
+        subp.add_argument(
+            "-h", "--help", action="help", help="Show this help message and exit."
+        )
+
+    def call_args(self, func_meta, namespace):
+        """collect the function, args and kwargs of a command from a parsed namespace"""
+        args = []
+        kwargs = {}
+
+        # if variadic define args and kwargs
+        if func_meta.variadic:
+            func = func_meta.func
+            try:
+                for arg in vars(namespace)['*args']:
+                    if '=' in arg:
+                        k,v = arg.split('=')
+                        kwargs[k] = v
                     else:
-                        subp.add_argument(
-                            name, type=atype, help=str(atype) if atype is not None else None
-                        )
+                        args.append(arg)
+            except KeyError:
+                # pass because args & kwargs are already defined empty
+                pass
+        else:
 
-            # overide help & place at end of options
-            subp.add_argument(
-                "-h", "--help", action="help", help="Show this help message and exit."
+            # unpack just the args and function
+            func, arg_names = (
+                func_meta.func,
+                func_meta.names,
             )
 
-    def parse(self):
-        """initialize parsing args"""
+            # collect args from input namespace
+            args = [getattr(namespace, arg) for arg in arg_names]
 
-        self.input = self.parser.parse_args()
+        return func, args, kwargs
 
-        # if command in input namespace
-        if self.input.command:
-            # retrieve function and arg names for given command
-            func_meta = self.func_dict[self.input.command]
-            args = []
-            kwargs = {}
-
-            # if variadic define args and kwargs
-            if func_meta['variadic']:
-                func = func_meta['func']
+    def bench(self, target, argv, number=None, repeat=5, warmup=1, procs=None):
+        """benchmark a registered command
+
+        :param target: name of the command
+        :param argv: command line arguments of the command
+        :param number: calls per repetition, calibrated like timeit when None
+        :param repeat: number of timed repetitions
+        :param warmup: number of untimed calls before timing
+        :param procs: number of processes to repeat the calls in to check scaling
+        :return: report string
+        """
+        self.build(target)
+        namespace = self.subparsers.choices[target].parse_args(argv)
+        func, args, kwargs = self.call_args(self.func_dict[target], namespace)
+
+        # time coroutines on the long lived event loop
+        coroutine = self.func_dict[target].mode == 'coroutine'
+        if coroutine:
+            coro_func = func
+            func = lambda *a, **k: self.run_coroutine(coro_func(*a, **k))
+
+        for _ in range(warmup):
+            func(*args, **kwargs)
+
+        # calibrate the calls per repetition like timeit.Timer.autorange
+        if not number:
+            number = 1
+            for scale in (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000):
+                number = scale
+                if timed(func, args, kwargs, number) >= 0.2:
+                    break
+
+        # exact order statistics of the few per repetition times per call
+        import math, statistics
+
+        times = sorted(timed(func, args, kwargs, number) / number for _ in range(repeat))
+        p95 = times[max(math.ceil(0.95 * len(times)) - 1, 0)]  # nearest rank
+        stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+
+        lines = [
+            f"{target}: {number} calls x {repeat} repeats",
+            f"min {format_time(times[0])}  median {format_time(statistics.median(times))}  "
+            f"p95 {format_time(p95)}  stdev {format_time(stdev)}",
+        ]
+
+        # compare the throughput of the repetitions in a process pool against a single process
+        if procs and not coroutine:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                timed(func, args, kwargs, number)
+            serial = repeat * number / (time.perf_counter() - start)
+
+            # forked workers look the command up by name, decorated functions need not pickle
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=procs, mp_context=context,
+                                     initializer=batch_init, initargs=(self,)) as pool:
+                # start the workers before timing
+                list(pool.map(bench_worker, [target] * procs, [args] * procs, [kwargs] * procs, [1] * procs))
+
+                start = time.perf_counter()
+                list(pool.map(bench_worker, [target] * repeat * procs, [args] * repeat * procs,
+                              [kwargs] * repeat * procs, [number] * repeat * procs))
+                parallel = repeat * procs * number / (time.perf_counter() - start)
+
+            lines.append(
+                f"procs {procs}: {parallel / serial:.2f}x speedup "
+                f"({parallel:,.0f} calls/s vs {serial:,.0f} calls/s)"
+            )
+        elif procs:
+            lines.append(f"procs {procs}: ignored, coroutine commands are timed on the event loop of this process")
+        return "\n".join(lines)
+
+    def command_of(self, argv):
+        """find the command name in command line arguments without parsing them"""
+        tokens = iter(argv)
+        for token in tokens:
+            if not token.startswith("-"):
+                return token
+
+            # skip the value of top-level options taking one
+            action = self.parser._option_string_actions.get(token.split("=")[0])
+            if action is not None and action.nargs != 0 and "=" not in token:
+                next(tokens, None)
+        return None
+
+    def parse_args(self, args=None):
+        """parse command line arguments, building only the subparsers needed
+
+        :param args: command line arguments, defaults to sys.argv[1:]
+        :return: parsed namespace
+        """
+
+        # build only the subparser of the invoked command, all of them for help or unknown commands
+        command = self.command_of(sys.argv[1:] if args is None else args)
+        if command in self.func_dict:
+            self.build(command)
+        elif command == "bench":
+            self.add_bench()
+        else:
+            self.build_all()
+
+        if args is None:
+            return self.parser.parse_args()
+        return self.parser.parse_args(args)
+
+    def dispatch(self, namespace):
+        """run the command of a parsed namespace
+
+        :return: the value returned by the command
+        """
+        # run the bench command
+        if namespace.command == "bench" and "bench" not in self.func_dict:
+            return self.bench(namespace.target, namespace.args, namespace.number,
+                              namespace.repeat, namespace.warmup, namespace.procs)
+
+        # retrieve function and arg names for given command
+        func_meta = self.func_dict[namespace.command]
+        if getattr(namespace, "_su_map", None):
+            return self.map(func_meta, namespace, namespace._su_map, namespace._su_workers, namespace._su_chunksize)
+        func, args, kwargs = self.call_args(func_meta, namespace)
+
+        # run function with given args and collect any returns
+        if func_meta.mode == 'coroutine':
+            return self.run_coroutine(func(*args, **kwargs))
+        return func(*args, **kwargs)
+
+    def map(self, func_meta, namespace, pool="thread", workers=None, chunksize=1):
+        """call a variadic command once per positional argument, key=value arguments are passed to every call
+
+        :param pool: thread, process or async, process pools fork the current process
+        :param workers: number of workers, or concurrent calls for async, defaults to the pool default
+        :param chunksize: arguments sent to a process worker at once
+        :return: list of returned values in argument order
+        """
+        if not func_meta.variadic:
+            self.parser.error(f"--map needs a variadic command, {func_meta.name} is not")
+        func, items, kwargs = self.call_args(func_meta, namespace)
+
+        if pool == "async":
+            import asyncio
+
+            async def gather():
+                semaphore = asyncio.Semaphore(workers) if workers else None
+                loop = asyncio.get_event_loop()
+
+                async def call(item):
+                    if func_meta.mode == 'coroutine':
+                        return await func(item, **kwargs)
+                    return await loop.run_in_executor(None, lambda: func(item, **kwargs))
+
+                async def limited(item):
+                    if semaphore is None:
+                        return await call(item)
+                    async with semaphore:
+                        return await call(item)
+
+                return await asyncio.gather(*(limited(item) for item in items))
+
+            return self.run_coroutine(gather())
+
+        if pool == "process":
+            from concurrent.futures import ProcessPoolExecutor
+            import functools, multiprocessing
+
+            # forked workers look the command up by name, decorated functions need not pickle
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=batch_init, initargs=(self,)) as executor:
+                return list(executor.map(functools.partial(map_worker, func_meta.name, kwargs), items,
+                                         chunksize=max(chunksize, 1)))
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        def call(item):
+            if func_meta.mode == 'coroutine':
+                return self.run_coroutine(func(item, **kwargs))
+            return func(item, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(call, items))
+
+    def output(self, returned, mapped=False, jsonl=False):
+        """print the value returned by a command
+
+        iterators, generators and async generators stream one line per item as produced,
+        as do map results and, given jsonl, lists and tuples
+
+        :param mapped: the value is the list of results of a map
+        :param jsonl: print json lines instead of text
+        """
+        from collections.abc import AsyncIterator, Iterator
+
+        if isinstance(returned, AsyncIterator):
+            returned = self.iterate(returned)
+        elif not (mapped or isinstance(returned, Iterator) or (jsonl and isinstance(returned, (list, tuple)))):
+            # a single value
+            if jsonl and returned is not None:
+                print(json.dumps(returned, default=str))
+            elif not jsonl and returned:
+                print(returned)
+            return
+
+        # write items to the buffered stream as produced, one line at a time
+        write = sys.stdout.write
+        if jsonl:
+            encode = json.JSONEncoder(default=str).encode
+            for item in returned:
+                write(encode(item) + "\n")
+        else:
+            for item in returned:
+                if item is not None:
+                    write(f"{item}\n")
+        sys.stdout.flush()
+
+    def iterate(self, aiterator):
+        """iterate an async iterator on the event loop of the calling thread"""
+        while True:
+            try:
+                yield self.run_coroutine(aiterator.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def new_loop(self):
+        """create an event loop with the loop factory"""
+        import asyncio
+
+        loop = (self.loop_factory or asyncio.new_event_loop)()
+        self.all_loops.append(loop)
+        return loop
+
+    @property
+    def loop(self):
+        """long lived event loop of the calling thread, shared by its async commands"""
+        loop = getattr(self.loops, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = self.loops.loop = self.new_loop()
+        return loop
+
+    def run_coroutine(self, coro):
+        """run a coroutine to completion on the event loop of the calling thread"""
+        return self.loop.run_until_complete(coro)
+
+    def close(self):
+        """close the event loops of async commands"""
+        loops, self.all_loops = self.all_loops, []
+        for loop in loops:
+            if not loop.is_closed():
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                if hasattr(loop, "shutdown_default_executor"):
+                    loop.run_until_complete(loop.shutdown_default_executor())
+                loop.close()
+        self.loops = threading.local()
+
+    async def acall(self, args):
+        """run a command line on the running event loop, sync commands in its default executor
+
+        :param args: command line arguments
+        :return: the value returned by the command
+        """
+        import asyncio
+
+        namespace = self.parse_args(args)
+        if not namespace.command:
+            return None
+        func_meta = self.func_dict.get(namespace.command)
+        if func_meta is not None and func_meta.mode == 'coroutine':
+            func, args, kwargs = self.call_args(func_meta, namespace)
+            return await func(*args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(None, self.dispatch, namespace)
+
+    def gather(self, argvs, limit=None):
+        """run command lines concurrently on the event loop with asyncio.gather
+
+        :param argvs: list of command line arguments
+        :param limit: maximum number of commands running at once, unlimited when None
+        :return: list of returned values or raised exceptions, in input order
+        """
+        import asyncio
+
+        async def gather():
+            semaphore = asyncio.Semaphore(limit) if limit else None
+
+            async def call(argv):
+                # asyncio reraises SystemExit out of the loop, return it like other failures
                 try:
-                    for arg in vars(self.input)['*args']:
-                        if '=' in arg:
-                            k,v = arg.split('=')
-                            kwargs[k] = v
-                        else:
-                            args.append(arg)
-                except KeyError:
-                    # pass because args & kwargs are already defined empty
-                    pass
-            else:
+                    if semaphore is None:
+                        return await self.acall(argv)
+                    async with semaphore:
+                        return await self.acall(argv)
+                except SystemExit as error:
+                    return error
+
+            return await asyncio.gather(*(call(argv) for argv in argvs), return_exceptions=True)
+
+        return self.run_coroutine(gather())
+
+    def call(self, args):
+        """run a command line without exiting
+
+        :param args: command line arguments
+        :return: the value returned by the command
+        """
+        namespace = self.parse_args(args)
+        if namespace.command:
+            return self.dispatch(namespace)
+
+    def batch_argv(self, line):
+        """command line arguments of a batch line
+
+        a line is a shell style command line, a json list of arguments or a json
+        object {"command": name, "args": [...], "kwargs": {...}}
+        """
+        import shlex
+
+        line = line.strip()
+        if line[:1] == "[":
+            return [str(arg) for arg in json.loads(line)]
+        elif line[:1] == "{":
+            record = json.loads(line)
+            argv = [record["command"]] + [str(arg) for arg in record.get("args", [])]
+            func_meta = self.func_dict.get(record["command"])
+            for key, value in record.get("kwargs", {}).items():
+                # variadic commands take keyword arguments as key=value
+                if func_meta is not None and func_meta.variadic:
+                    argv.append(f"{key}={value}")
+                else:
+                    argv += [f"--{key}", str(value)]
+            return argv
+        return shlex.split(line)
+
+    def batch(self, lines, workers=1, pool="thread", ordered=True):
+        """run many command lines, in a pool of workers given more than one
+
+        blank lines and lines starting with # are skipped
+
+        :param lines: iterable of batch lines, see batch_argv
+        :param workers: number of workers
+        :param pool: thread or process, process pools fork the current process
+        :param ordered: yield results in input order instead of as they complete
+        :return: generator of (line number, returned value, error message or None)
+        """
+        # build every subparser before the workers share the parser
+        self.build_all()
+        workers = workers or 1
+        commands = ((number, line) for number, line in enumerate(lines, 1)
+                    if line.strip() and not line.lstrip().startswith("#"))
+
+        if pool == "async":
+            # step the batch on the event loop, yielding each result as it is available
+            yield from self.iterate(self.abatch(commands, workers, ordered))
+            return
+
+        if workers <= 1:
+            for number, line in commands:
+                yield (number,) + batch_call(self, line)
+            return
+
+        if pool == "process":
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                           initializer=batch_init, initargs=(self,))
+            func = batch_worker
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            executor = ThreadPoolExecutor(max_workers=workers)
+            func = lambda line: batch_call(self, line)
+
+        with executor:
+            # keep a few lines per worker in flight so input is read as results are consumed
+            for (number, line), result in pool_map(executor, func, commands, workers * 4, ordered,
+                                                   key=lambda command: command[1]):
+                yield (number,) + result
+
+    async def abatch(self, commands, limit, ordered=True):
+        """run numbered batch lines as tasks of the running event loop, at most limit at once
 
-                # unpack just the args and function
-                func, arg_names = (
-                    func_meta['func'],
-                    func_meta['names'],
-                )
-            
-                # collect args from input namespace
-                args = [getattr(self.input, arg) for arg in arg_names]
-            
-            # run function with given args and collect any returns
-            if asyncio.iscoroutinefunction(func):
-                returned = asyncio.run(func(*args, **kwargs))
+        :return: async generator of (line number, returned value, error message or None)
+        """
+        import asyncio
+        from collections import deque
+
+        commands = iter(commands)
+        pending = {}  # task -> line number
+        order = deque()  # tasks in submission order when ordered
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max(limit, 1):
+                try:
+                    number, line = next(commands)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(abatch_call(self, line))
+                pending[task] = number
+                if ordered:
+                    order.append(task)
+
+            if not pending:
+                return
+            if ordered:
+                done = [order.popleft()]
+                await asyncio.wait(done)
             else:
-                returned = func(*args, **kwargs)
+                done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield (pending.pop(task),) + task.result()
 
-            # print return if not None
-            if returned:
-                print(returned)
+    def run_batch(self, source, workers=1, pool="thread", ordered=True, jsonl=False):
+        """run the command lines of a file printing results as they are available
+
+        :param source: path of the file, - for stdin
+        :param jsonl: print a json line {"line": number, "result": value} per command
+        :return: exit code, 1 when a command failed
+        """
+        from collections.abc import AsyncIterator, Iterator
+
+        failed = False
+        file = sys.stdin if source == "-" else open(source)
+        try:
+            for number, returned, error in self.batch(file, workers, pool, ordered):
+                if error:
+                    failed = True
+                    print(f"line {number}: {error}", file=sys.stderr, flush=True)
+                elif jsonl:
+                    if isinstance(returned, AsyncIterator):
+                        returned = self.iterate(returned)
+                    if isinstance(returned, Iterator):
+                        returned = list(returned)
+                    print(json.dumps({"line": number, "result": returned}, default=str), flush=True)
+                else:
+                    self.output(returned)
+                    sys.stdout.flush()
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        return 1 if failed else 0
+
+    def run(self, args):
+        """run a command line without exiting, printing its return like parse
+
+        :param args: command line arguments
+        """
+        namespace = self.parse_args(args)
+        if namespace.command:
+            self.output(self.dispatch(namespace), bool(getattr(namespace, "_su_map", None)),
+                        getattr(namespace, "_su_jsonl", False))
+
+    def parse(self, args=None):
+        """initialize parsing args
+
+        :param args: command line arguments, defaults to sys.argv[1:]
+        """
+        self.input = self.parse_args(args)
+
+        # keep the module resident serving commands
+        if getattr(self.input, "_su_serve", None):
+            self.serve(self.input._su_serve)
+            sys.exit()
+
+        # run the command lines of a file
+        if getattr(self.input, "_su_batch", None):
+            code = self.run_batch(self.input._su_batch, self.input._su_workers, self.input._su_pool,
+                                  not self.input._su_unordered, self.input._su_jsonl)
+            self.close()
+            sys.exit(code)
+
+        # if command in input namespace
+        if self.input.command:
+            returned = self.dispatch(self.input)
+
+            # print return if not None, streaming iterators
+            try:
+                self.output(returned, bool(getattr(self.input, "_su_map", None)),
+                            getattr(self.input, "_su_jsonl", False))
+            except BrokenPipeError:
+                # the reader stopped early, i.e. head, silence the flush at exit
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+            self.close()
 
             # exit the interpreter so the entire script is not run
             sys.exit() 
+
+    def server(self, path):
+        """create a unix socket server running command lines of this cli
+
+        each connection sends one json line {"argv": [...], "stdin": "..."} and receives
+        one json line {"stdout": "...", "stderr": "...", "code": 0}
+
+        :param path: path of the unix socket
+        :return: socketserver.UnixStreamServer, closing removes the socket file
+        """
+        import socketserver
+
+        cli_obj = self
+        self.build_all()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                # connections closed without a request, i.e. probes of a starting server
+                if not line:
+                    return
+                request = json.loads(line)
+                response = cli_obj.respond(request.get("argv", []), request.get("stdin", ""))
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        class Server(socketserver.UnixStreamServer):
+            def server_close(self):
+                super().server_close()
+                if os.path.exists(path):
+                    os.unlink(path)
+
+        # replace a socket left over by a server that did not exit cleanly, nothing else
+        if os.path.lexists(path):
+            import socket, stat
+
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(path)
+                except ConnectionRefusedError:
+                    os.unlink(path)
+                else:
+                    raise FileExistsError(f"a server is already running on {path}")
+        return Server(path, Handler)
+
+    def serve(self, path):
+        """serve command lines on a unix socket until interrupted
+
+        :param path: path of the unix socket
+        """
+        try:
+            server = self.server(path)
+        except FileExistsError as error:
+            self.parser.error(str(error))
+        with server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.close()
+
+    def respond(self, argv, stdin=""):
+        """run a command line capturing its output and exit code
+
+        :param argv: command line arguments
+        :param stdin: text made available as standard input
+        :return: dict of stdout, stderr and code
+        """
+        import io, contextlib, traceback
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        code = 0
+        saved_stdin, sys.stdin = sys.stdin, io.StringIO(stdin)
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    self.run(argv)
+                except SystemExit as error:
+                    # argparse errors, help and sys.exit calls of commands
+                    if error.code is None or isinstance(error.code, int):
+                        code = error.code or 0
+                    else:
+                        print(error.code, file=sys.stderr)
+                        code = 1
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+        finally:
+            sys.stdin = saved_stdin
+        return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "code": code}
+
+
+def batch_call(cli_obj, line):
+    """run a batch line, catching failures so one line does not stop the batch
+
+    :return: (returned value, error message or None)
+    """
+    try:
+        return cli_obj.call(cli_obj.batch_argv(line)), None
+    except (SystemExit, Exception) as error:
+        return None, batch_error(error)
+
+
+async def abatch_call(cli_obj, line):
+    """run a batch line on the running event loop, see batch_call"""
+    try:
+        return await cli_obj.acall(cli_obj.batch_argv(line)), None
+    except (SystemExit, Exception) as error:
+        return None, batch_error(error)
+
+
+def batch_error(error):
+    """error message of a failed batch line, None for successful exits"""
+    # argparse errors and sys.exit calls of commands
+    if isinstance(error, SystemExit):
+        return None if error.code is None or error.code == 0 else f"exit {error.code}"
+    return f"{type(error).__name__}: {error}"
+
+
+worker_cli = None  # cli of a batch or map process worker
+
+
+def batch_init(cli_obj):
+    """set the cli of a forked batch or map worker"""
+    global worker_cli
+    worker_cli = cli_obj
+    # loops of the parent process are not usable after fork
+    cli_obj.all_loops = []
+    cli_obj.loops = threading.local()
+
+
+def batch_worker(line):
+    """run a batch line in a process worker"""
+    return batch_call(worker_cli, line)
+
+
+def map_worker(name, kwargs, item):
+    """call a command with one argument of a map in a process worker"""
+    returned = worker_cli.func_dict[name].func(item, **kwargs)
+    if worker_cli.func_dict[name].mode == 'coroutine':
+        returned = worker_cli.run_coroutine(returned)
+    return returned
+
+
+def bench_worker(name, args, kwargs, number):
+    """time calls of a command in a bench process worker"""
+    return timed(worker_cli.func_dict[name].func, args, kwargs, number)
+
+
+def pool_map(executor, func, items, window, ordered=True, key=None):
+    """map func over items in an executor with at most window calls in flight
+
+    :param key: argument of func for an item, defaults to the item
+    :return: generator of (item, result), in input order or as completed
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    from collections import deque
+
+    items = iter(items)
+    pending = {}  # future -> item
+    order = deque()  # futures in submission order when ordered
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < window:
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            future = executor.submit(func, item if key is None else key(item))
+            pending[future] = item
+            if ordered:
+                order.append(future)
+
+        if not pending:
+            return
+        if ordered:
+            done = [order.popleft()]
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+
+def request(path, argv, stdin=""):
+    """send a command line to a cli server
+
+    :param path: path of the unix socket
+    :param argv: command line arguments
+    :param stdin: text made available as standard input
+    :return: dict of stdout, stderr and code
+    """
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile("rwb") as stream:
+            stream.write(json.dumps({"argv": list(argv), "stdin": stdin}).encode() + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+
+def client(path, argv, forward_stdin=True):
+    """forward a command line, standard input and output to a cli server
+
+    :param path: path of the unix socket
+    :param argv: command line arguments
+    :param forward_stdin: send standard input when it is a pipe or a file
+    :return: exit code of the command
+    """
+    import stat
+
+    # terminals and devices never reach end of file, so only pipes and files are sent
+    stdin = ""
+    if forward_stdin and sys.stdin is not None:
+        try:
+            mode = os.fstat(sys.stdin.fileno()).st_mode
+        except (OSError, ValueError):
+            mode = 0
+        if stat.S_ISFIFO(mode) or stat.S_ISREG(mode):
+            stdin = sys.stdin.read()
+    response = request(path, argv, stdin)
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["code"]
+
+
+def command_spec(func_name, items):
+    """compute the json serializable argparse specification of a registered function
+
+    :param items: meta_handler.FuncMeta of the function
+    """
+    names = items.names  # collect arg names
+    types = items.types  # collect types of arg
+    arg_types = [types.get(name, None) for name in names]
+    defaults = items.defaults  # collect default args
+
+    # init arg help and arg description
+    ahelp = f"execute {func_name} function"
+
+    # collect command description
+    adesc = items.signature_text()
+
+    # define help string
+    if items.desc is not None:
+        ahelp = items.desc
+
+    # create abbreviations for named short name
+    arguments = []
+    abbrevs = set()
+    for name, atype in zip(names, arg_types):
+        # if arg is contains a default define a short name
+        if name in defaults:
+            # default abbreviation is the first 2 characters
+            short_name = name[:2]
+            # if space is taken define short name as just the list character
+            if short_name in abbrevs:
+                short_name = name[-1]
+            abbrevs.add(short_name)
+
+            arguments.append({
+                'name': name,
+                'flags': [f"-{short_name}", f"--{name}"],
+                'metavar': str(atype) if atype is not None else None,
+                'help': f"default: {defaults[name]}",
+            })
+        else:
+            arguments.append({
+                'name': name,
+                'flags': [name],
+                'nargs': '*' if items.variadic else None,
+                'help': str(atype) if atype is not None else None,
+            })
+
+    return {'help': ahelp, 'description': adesc, 'arguments': arguments}
+
+
+class SpecCache:
+    """on disk cache of the command specifications of a module
+
+    the cache is keyed by the module path and is valid while the module
+    mtime and size, or else the hash of its source, are unchanged, each
+    command is also checked against the mtime and size of the file defining it
+    """
+
+    version = 2  # bump when the specification format changes
+
+    def __init__(self, path, folder=None):
+        self.path = os.path.abspath(path)
+        if not folder:
+            folder = os.environ.get("SUTOOLS_CACHE") or os.path.join(
+                os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                "sutools",
+            )
+        import hashlib
+
+        key = hashlib.sha1(self.path.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        self.file = os.path.join(folder, f"{name}-{key}.json")
+
+    @staticmethod
+    def source(func, stats):
+        """[path, mtime, size] of the file defining a function, None when it has no source file
+
+        :param stats: dict of already read files, shared by the functions of a module
+        """
+        while hasattr(func, "__wrapped__"):
+            func = func.__wrapped__
+        code = getattr(func, "__code__", None)
+        if code is None:
+            return None
+        path = code.co_filename
+        if path not in stats:
+            try:
+                stat = os.stat(path)
+                stats[path] = [os.path.abspath(path), stat.st_mtime, stat.st_size]
+            except OSError:
+                stats[path] = None
+        return stats[path]
+
+    def digest(self):
+        """hash of the module source"""
+        import hashlib
+
+        with open(self.path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def load(self):
+        """load the cached specifications, empty when missing or stale"""
+        try:
+            with open(self.file) as file:
+                cached = json.load(file)
+            stat = os.stat(self.path)
+        except (OSError, ValueError):
+            return {}
+        if cached.get("version") != self.version or cached.get("path") != self.path:
+            return {}
+
+        # a changed mtime or size only invalidates the cache when the source changed
+        if [cached.get("mtime"), cached.get("size")] != [stat.st_mtime, stat.st_size]:
+            if cached.get("hash") != self.digest():
+                return {}
+            cached["mtime"], cached["size"] = stat.st_mtime, stat.st_size
+            self.write(cached)
+        return cached["commands"]
+
+    def save(self, specs):
+        """save the specifications of the current module source"""
+        try:
+            stat = os.stat(self.path)
+            self.write({
+                "version": self.version,
+                "path": self.path,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "hash": self.digest(),
+                "commands": specs,
+            })
+        except OSError:
+            # an unwritable cache only costs the introspection
+            pass
+
+    def write(self, cached):
+        """atomically replace the cache file"""
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        tmp = f"{self.file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(cached, file)
+        os.replace(tmp, self.file)
+
+
+def complete(path, words, folder=None):
+    """completion candidates for the last word of a command line from the cache of a module
+
+    :param path: path of the module
+    :param words: command line words after the module, the last one is completed
+    :param folder: cache folder, defaults to the user cache folder
+    :return: list of candidates
+    """
+    specs = SpecCache(path, folder).load()
+    words = list(words) or [""]
+    current = words[-1]
+
+    # complete the command name
+    if len(words) == 1:
+        candidates = list(specs)
+    # complete the options of the command
+    elif words[0] in specs:
+        candidates = [flag for arg in specs[words[0]]["arguments"] for flag in arg["flags"]
+                      if flag.startswith("--")] + ["--help"]
+    else:
+        candidates = []
+    return [candidate for candidate in candidates if candidate.startswith(current)]
+
+
+def timed(func, args, kwargs, number):
+    """seconds taken by a number of calls of a function"""
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def format_time(seconds):
+    """format seconds with a readable unit"""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g}{unit}"
+    return f"{seconds / 1e-9:.3g}ns"
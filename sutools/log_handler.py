@@ -1,6 +1,285 @@
-import logging, os, datetime, warnings, atexit
+import logging, os, sys, datetime, warnings, atexit, threading, json, time, weakref
+from queue import Queue, Full, Empty
 from types import SimpleNamespace
 
+# policies of a full log queue
+OVERFLOW = ("block", "drop", "drop-oldest")
+
+
+# loggers and handlers reset in forked children, held weakly so closed ones can be collected
+forkable = weakref.WeakSet()
+
+
+def forked_all():
+    """reset the loggers and handlers a forked child copied from its parent"""
+    for instance in list(forkable):
+        instance._forked()
+
+
+# one hook for all instances, per instance hooks could never be removed
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forked_all)
+
+
+def flush_weak(ref):
+    """flush a handler at the exit of a pool worker if it is still alive"""
+    handler = ref()
+    if handler is not None:
+        handler.flush()
+
+
+def finalize_weak(handler):
+    """flush a handler at the exit of a multiprocessing worker
+
+    registered after the worker clears the finalizers it copied from its parent
+    """
+    util = sys.modules["multiprocessing.util"]
+    util.Finalize(None, flush_weak, args=(weakref.ref(handler),), exitpriority=10)
+
+
+# time units of timeout and rotation period strings
+TIME_UNITS = {"m": "minutes", "h": "hours", "d": "days", "o": "months", "y": "years"}
+
+
+def period(text):
+    """timedelta of a period string, i.e. '10d' for 10 days, raises KeyError for an unknown unit"""
+    time_unit = TIME_UNITS[text[-1]]
+    time_amount = int(text[:-1])
+    if time_unit == "years":
+        return datetime.timedelta(days=time_amount * 365)
+    if time_unit == "months":
+        return datetime.timedelta(days=time_amount * 30)
+    return datetime.timedelta(**{time_unit: time_amount})
+
+
+# attributes of every log record, any other attribute is an extra field
+RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None)))
+# attributes of a record once its message is formatted
+RECORD_SIZE = len(RECORD_ATTRS) + 1
+RECORD_ATTRS |= {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """formatter writing each record as one json object per line
+
+    objects hold the time, logger name, level, message, extra fields and the formatted
+    exception or stack when present
+    """
+
+    # string values are escaped by the c encoder of the json module, other values are encoded
+    # compactly with values json cannot encode written as strings
+    escape = staticmethod(json.encoder.encode_basestring)
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+
+    def __init__(self, fields=None, utc=True):
+        """
+        :param fields: dict of json key to record attribute, defaults to name, level and message
+        :param utc: write times in utc instead of local time
+        """
+        super().__init__()
+        fields = fields or {"name": "name", "level": "levelname", "message": "message"}
+        # keys are escaped once, each line only joins the values
+        self.fields = tuple((f",{self.escape(key)}:", attr) for key, attr in fields.items())
+        self.converter = time.gmtime if utc else time.localtime
+        self.suffix = 'Z"' if utc else '"'
+        # (second, prefix) replaced as one value, handlers sharing the formatter may format concurrently
+        self.cached = (None, "")
+
+    def format_time(self, record):
+        """iso 8601 time of a record as a json string, formatting each second once"""
+        second = int(record.created)
+        cached_second, prefix = self.cached
+        if second != cached_second:
+            prefix = time.strftime('{"time":"%Y-%m-%dT%H:%M:%S', self.converter(second))
+            self.cached = (second, prefix)
+        return f"{prefix}.{int(record.msecs):03d}{self.suffix}"
+
+    def value(self, value):
+        """json text of a value"""
+        return self.escape(value) if type(value) is str else self.encode(value)
+
+    def format(self, record):
+        record.message = record.getMessage()
+        line = self.format_time(record)
+        for key, attr in self.fields:
+            line += key + self.value(getattr(record, attr, None))
+
+        # extra fields passed with extra={...}, only looked up when the record has more attributes
+        attrs = record.__dict__
+        if len(attrs) > RECORD_SIZE:
+            for key in attrs.keys() - RECORD_ATTRS:
+                line += "," + self.escape(key) + ":" + self.value(attrs[key])
+
+        if record.exc_info:
+            # cache the traceback text like logging.Formatter
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += ',"exc_info":' + self.escape(record.exc_text)
+        if record.stack_info:
+            line += ',"stack_info":' + self.escape(self.formatStack(record.stack_info))
+        return line + "}"
+
+
+class QueueHandler(logging.Handler):
+    """handler putting records on a bounded queue, written by a QueueListener thread
+
+    records are formatted by the listener, arguments of a message should not be mutated after logging
+    """
+
+    def __init__(self, queue, overflow="block"):
+        super().__init__()
+        if overflow not in OVERFLOW:
+            raise ValueError(f"overflow must be one of {OVERFLOW}, not {overflow!r}")
+        self.queue = queue
+        self.overflow = overflow
+        self.dropped = 0  # records dropped by a full queue
+
+    def handle(self, record):
+        """enqueue a record without the handler lock, the queue is thread safe"""
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if self.overflow == "drop":
+                self.dropped += 1
+                return
+            # make room by discarding the oldest queued record
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(record)
+                    return
+                except Full:
+                    continue
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """file handler buffering formatted records to write them in few large writes
+
+    the buffer is written when it holds buffer_size characters, when a record at
+    flush_level or above is logged, and every flush_interval seconds
+    """
+
+    def __init__(self, filename, mode="a", encoding=None, delay=False,
+                 buffer_size=65536, flush_interval=1.0, flush_level=logging.ERROR):
+        super().__init__(filename, mode, encoding, delay)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer = []  # formatted records not yet written
+        self.buffered = 0  # characters in the buffer
+        self.closing = threading.Event()
+        self.timer = None
+        self.start_timer()
+        forkable.add(self)
+
+    def start_timer(self):
+        """write the buffer of idle loggers from a timer thread"""
+        if self.flush_interval:
+            self.timer = threading.Thread(target=self.flush_periodically, name="sutools-log-flush", daemon=True)
+            self.timer.start()
+
+    def _forked(self):
+        """drop the records buffered by the parent, which writes them, and restart the timer in a forked child"""
+        self.buffer = []
+        self.buffered = 0
+        if self.closing.is_set():
+            return
+        self.closing = threading.Event()
+        self.start_timer()
+
+        # pool workers exit without running atexit handlers, their finalizers write the buffer
+        util = sys.modules.get("multiprocessing.util")
+        if util is not None:
+            util.register_after_fork(self, finalize_weak)
+
+    def emit(self, record):
+        try:
+            text = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size or record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self):
+        """write the buffered records to the file"""
+        self.acquire()
+        try:
+            if self.buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write("".join(self.buffer))
+                self.buffer.clear()
+                self.buffered = 0
+            super().flush()
+        finally:
+            self.release()
+
+    def flush_periodically(self):
+        """flush every flush_interval seconds until closed"""
+        while not self.closing.wait(self.flush_interval):
+            if self.buffer:
+                self.flush()
+
+    def close(self):
+        # the timer is not joined, logging.shutdown closes handlers holding their lock
+        self.closing.set()
+        self.flush()
+        super().close()
+
+
+class QueueListener(threading.Thread):
+    """thread writing queued records to handlers, draining the queue in batches"""
+
+    def __init__(self, queue, handlers, batch=512):
+        super().__init__(name="sutools-log-listener", daemon=True)
+        self.queue = queue
+        self.handlers = handlers
+        self.batch = batch
+        self.stopping = threading.Event()
+
+    def run(self):
+        get, get_nowait = self.queue.get, self.queue.get_nowait
+        while True:
+            try:
+                records = [get(timeout=0.1)]
+            except Empty:
+                # stop once stopping and the queue is drained
+                if self.stopping.is_set():
+                    return
+                continue
+
+            # take every record already queued to write them as one batch
+            try:
+                while len(records) < self.batch:
+                    records.append(get_nowait())
+            except Empty:
+                pass
+            for record in records:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+    def stop(self):
+        """write the queued records and stop the thread"""
+        self.stopping.set()
+        self.join()
+
 
 class Logger:
     """object designed for swift granular logging configuration"""
@@ -20,7 +299,19 @@ class Logger:
         streamfmt,
         shandler,
         stream,
+        queue=False,
+        queue_size=10000,
+        overflow="block",
+        rotate_size=None,
+        rotate_interval=None,
     ):
+        """
+        :param queue: write records from a background thread, logging calls only enqueue them
+        :param queue_size: maximum number of queued records
+        :param overflow: policy of a full queue; block, drop the new record or drop-oldest
+        :param rotate_size: start a new log file once the file holds this many bytes
+        :param rotate_interval: start a new log file after this many seconds or a period string, i.e. '1d'
+        """
         # set properties
         self.name = name
         self.loggers = {}
@@ -34,6 +325,8 @@ class Logger:
         self.fhandler = fhandler
         self.streamfmt = streamfmt
         self.shandler = shandler
+        self.filecap = filecap
+        self.filetimeout = filetimeout
 
         # iterate through loggers and add each to the root logger
         for log in loggers:
@@ -46,17 +339,16 @@ class Logger:
         self.loggers = SimpleNamespace(**self.loggers)
         self.rootlogger.setLevel(loglvl)  # set default log level
 
+        # handlers the loggers write to, directly or through the queue listener
+        handlers = []
+
         # if file property enabled create file logger
         if self.file:
             self.fhandler.setLevel(self.loglvl)  # set the level of the file handler
             self.fhandler.setFormatter(
                 self.filefmt
             )  # set the formatter for the file handler
-            for log in vars(self.loggers).keys():
-                logger = logging.getLogger(log)
-                logger.addHandler(self.fhandler)  # add the file handler to the logger
-                logger.propagate = False  # disable propagation of log messages
-            atexit.register(self.out)  # register out function at interpreter exit
+            handlers.append(self.fhandler)
 
         # if stream property enabled create stream logger
         if self.stream:
@@ -64,11 +356,34 @@ class Logger:
             self.shandler.setLevel(self.loglvl)
             # set the formatter for the stream handler
             self.shandler.setFormatter(self.streamfmt)
-            for log in vars(self.loggers).keys():
-                logger = logging.getLogger(log)
-                logger.addHandler(self.shandler)  # add the stream handler to the logger
+            handlers.append(self.shandler)
+
+        # if queue enabled loggers only enqueue records for a single listener thread
+        self.qhandler = None
+        self.listener = None
+        if queue and handlers:
+            self.qhandler = QueueHandler(Queue(queue_size), overflow)
+            self.listener = QueueListener(self.qhandler.queue, handlers)
+            self.listener.start()
+            handlers = [self.qhandler]
+            forkable.add(self)
+
+        for log in vars(self.loggers).keys():
+            logger = logging.getLogger(log)
+            for handler in handlers:
+                logger.addHandler(handler)  # add the file, stream or queue handler to the logger
+            if handlers:
                 logger.propagate = False  # disable propagation of log messages
 
+        # if rotation enabled a background thread checks the file and starts new ones
+        self.rotator = None
+        if self.file and (rotate_size or rotate_interval):
+            self.start_rotator(rotate_size, rotate_interval)
+
+        # register out function at interpreter exit
+        if self.file or self.listener:
+            atexit.register(self.out)
+
         # if a file cap is defined and type is int run cap function
         if filecap and isinstance(filecap, int):
             self.cap(filecap)
@@ -77,8 +392,104 @@ class Logger:
         if filetimeout and isinstance(filetimeout, str):
             self.timeout(filetimeout)
 
-    def cap(self, filecap):
-        """delete any file outside of range based on file age"""
+    def _forked(self):
+        """write directly from a forked child, the listener thread of the parent does not run in it
+
+        records the parent queued before the fork are left to the parent
+        """
+        if not self.listener:
+            return
+        for log in vars(self.loggers).keys():
+            logger = logging.getLogger(log)
+            logger.removeHandler(self.qhandler)
+            for handler in self.listener.handlers:
+                logger.addHandler(handler)
+        self.listener = None
+
+    # seconds between rotation checks
+    poll = 1.0
+
+    def start_rotator(self, rotate_size, rotate_interval):
+        """start the thread rotating the log file by size or age"""
+        if not isinstance(self.fhandler, logging.FileHandler):
+            warnings.warn("log rotation requires a logging.FileHandler", Warning)
+            return
+        if isinstance(rotate_interval, str):
+            try:
+                rotate_interval = period(rotate_interval).total_seconds()
+            except KeyError:
+                warnings.warn(f"Invalid time unit: {rotate_interval[-1]}", Warning)
+                rotate_interval = None
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        # files of a handler given by the caller keep its name as prefix, next to its file
+        if self.fhandler.baseFilename == os.path.abspath(self.filepath):
+            self.rotate_prefix = ""
+        else:
+            self.rotate_prefix = os.path.splitext(os.path.basename(self.fhandler.baseFilename))[0] + "_"
+        self.opened = time.monotonic()
+        self.closing = threading.Event()
+        self.rotator = threading.Thread(target=self.rotate_periodically, name="log-rotator", daemon=True)
+        self.rotator.start()
+
+    def rotate_periodically(self):
+        """rotate the log file once it is due until the logger is closed, pruning runs on this thread"""
+        while not self.closing.wait(self.poll):
+            if self.rotate_interval and time.monotonic() - self.opened >= self.rotate_interval:
+                self.rotate()
+            elif self.rotate_size:
+                try:
+                    size = os.path.getsize(self.fhandler.baseFilename)
+                except OSError:
+                    continue
+                if size >= self.rotate_size:
+                    self.rotate()
+
+    def rotate(self):
+        """continue logging in a new timestamped file and prune old files with filecap and filetimeout"""
+        handler = self.fhandler
+        parent_folder = os.path.dirname(handler.baseFilename)
+        filename = self.rotate_prefix + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filepath = os.path.join(parent_folder, f"{filename}.log")
+        # rotations within a second are numbered
+        count = 0
+        while os.path.exists(filepath):
+            count += 1
+            filepath = os.path.join(parent_folder, f"{filename}_{count}.log")
+
+        # logging calls only wait for the file swap, the handler lock is held while it writes
+        handler.acquire()
+        try:
+            previous = handler.baseFilename
+            handler.flush()
+            if handler.stream:
+                handler.stream.close()
+            handler.baseFilename = os.path.abspath(filepath)
+            handler.stream = handler._open()
+        finally:
+            handler.release()
+        # the logger follows the file being written, pruning runs in its folder
+        self.filename, self.filepath = filename, filepath
+        self.opened = time.monotonic()
+
+        # files rotated without records are removed like at exit
+        try:
+            if os.path.getsize(previous) == 0:
+                os.remove(previous)
+        except OSError:
+            pass
+
+        # prune old logs on rotation like at startup, quietly as stdout may carry command output
+        if self.filecap and isinstance(self.filecap, int):
+            self.cap(self.filecap, quiet=True)
+        if self.filetimeout and isinstance(self.filetimeout, str):
+            self.timeout(self.filetimeout, quiet=True)
+
+    def cap(self, filecap, quiet=False):
+        """delete any file outside of range based on file age
+
+        :param quiet: do not print the number of removed files
+        """
 
         parent_folder = os.path.dirname(self.filepath)
 
@@ -102,13 +513,16 @@ class Logger:
             )  # calculate the number of logs to remove
             for log in logs[filecap:]:
                 os.remove(log[0])  # remove file
-            if logs_to_remove > 1:
+            if logs_to_remove > 1 and not quiet:
                 print(f"filecap removed {logs_to_remove} logs")
-            else:
+            elif not quiet:
                 print("filecap reached")  # print if filecap is reached
 
-    def timeout(self, filetimeout):
-        """delete any file outside given time range"""
+    def timeout(self, filetimeout, quiet=False):
+        """delete any file outside given time range
+
+        :param quiet: do not print the number of removed files
+        """
         try:
             # get the path of the parent folder and find all log files in it
             parent_folder = os.path.dirname(self.filepath)
@@ -118,37 +532,19 @@ class Logger:
                 if f.endswith(".log")
             ]
 
-            # define time units and extract the amount and unit of the file timeout.
-            time_units = {
-                "m": "minutes",
-                "h": "hours",
-                "d": "days",
-                "o": "months",
-                "y": "years",
-            }
-            time_unit = time_units[filetimeout[-1]]
-            time_amount = int(filetimeout[:-1])
-
             # get the current time and calculate the time threshold based on the file timeout
-            now = datetime.datetime.now()
-            if time_unit == "years":
-                time_threshold = now - datetime.timedelta(days=time_amount * 365)
-            elif time_unit == "minutes":
-                time_threshold = now - datetime.timedelta(minutes=time_amount)
-            elif time_unit == "months":
-                time_threshold = now - datetime.timedelta(days=time_amount * 30)
-            else:
-                time_threshold = now - datetime.timedelta(**{time_unit: time_amount})
+            time_threshold = datetime.datetime.now() - period(filetimeout)
 
             # remove all logs that are older than the time threshold and count the number of logs removed
             logs_removed = 0
             for log in logs:
-                if os.path.getctime(log) < time_threshold.timestamp():
+                # the file being written is kept
+                if log != self.filepath and os.path.getctime(log) < time_threshold.timestamp():
                     os.remove(log)
                     logs_removed += 1
 
             # print the number of logs that were removed if any
-            if logs_removed > 0:
+            if logs_removed > 0 and not quiet:
                 print(f"timeout removed {logs_removed} logs")
 
         except KeyError:
@@ -160,6 +556,21 @@ class Logger:
         Check all loggers in the loggers namespace object for existing logs.
         If none exist, close the file fhandlers and remove the empty file
         """
+        # stop rotating before the last records are written
+        if self.rotator:
+            self.closing.set()
+            self.rotator.join()
+            self.rotator = None
+
+        # write the queued records before closing the handlers
+        if self.listener:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+            if self.qhandler.dropped:
+                print(f"log queue dropped {self.qhandler.dropped} records")
+
         # check each logger for existing handlers and set to null if they exist
         for log in vars(self.loggers).values():
             if log.hasHandlers():
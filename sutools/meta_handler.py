@@ -1,4 +1,154 @@
-import inspect
+import inspect, os, sys, threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def prog_path():
+    """file of the running program without loading any source, unlike inspect.stack()"""
+    # scripts are named by their file, embedded interpreters by their outermost frame
+    path = getattr(sys.modules.get("__main__"), "__file__", None)
+    if not path:
+        frame = sys._getframe()
+        while frame.f_back:
+            frame = frame.f_back
+        path = frame.f_code.co_filename
+    return path
+
+
+def prog_name():
+    """name of the running program without loading any source, unlike inspect.stack()"""
+    main = sys.modules.get("__main__")
+
+    # modules run with `python -m` are named by their module spec
+    spec = getattr(main, "__spec__", None)
+    if spec is not None and spec.name:
+        name = spec.name
+        if name.endswith(".__main__"):
+            name = name[: -len(".__main__")]
+        return name.rpartition(".")[2]
+
+    return os.path.splitext(os.path.basename(prog_path()))[0]
+
+
+def func_mode(func):
+    """how a function is called; function, coroutine, generator or asyncgen"""
+    if inspect.iscoroutinefunction(func):
+        return 'coroutine'
+    elif inspect.isasyncgenfunction(func):
+        return 'asyncgen'
+    elif inspect.isgeneratorfunction(func):
+        return 'generator'
+    return 'function'
+
+
+class FuncMeta(Mapping):
+    """immutable meta info of a registered function, computed from a single signature
+
+    reads as the legacy mapping of func, names, types, defaults, desc and variadic,
+    the signature is only computed on first access to a field other than func and name
+    """
+
+    __slots__ = ('func', 'name', 'names', 'kinds', 'types', 'defaults', 'desc', 'variadic', 'mode', 'signature')
+    keys_ = ('func', 'names', 'types', 'defaults', 'desc', 'variadic')
+    lock = threading.Lock()  # computes each record at most once across threads
+
+    def __init__(self, func):
+        object.__setattr__(self, 'func', func)
+        object.__setattr__(self, 'name', func.__name__)
+
+    def __getattr__(self, name):
+        """compute the deferred fields on first access"""
+        if name not in self.__slots__:
+            raise AttributeError(name)
+        with self.lock:
+            try:
+                object.__getattribute__(self, 'signature')
+            except AttributeError:
+                self._compute()
+        return object.__getattribute__(self, name)
+
+    def _compute(self):
+        """introspect the function from a single signature"""
+        func = self.func
+        signature = inspect.signature(func)
+        names = []
+        kinds = []
+        types = {}
+        defaults = {}
+        variadic = False
+        has_variadic = False
+
+        for name, param in signature.parameters.items():
+            kinds.append(param.kind.name)
+            if param.annotation is not inspect.Parameter.empty:
+                types[name] = param.annotation
+            if param.default is not inspect.Parameter.empty:
+                defaults[name] = param.default
+            # variadic when the signature ends with *args or **kwargs
+            variadic = param.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+            if variadic:
+                names.append(str(param))
+                has_variadic = True
+            elif param.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+                names.append(name)
+
+        if signature.return_annotation is not inspect.Signature.empty:
+            types['return'] = signature.return_annotation
+
+        # variadic functions take untyped args
+        if has_variadic:
+            types = {}
+
+        # the signature is set last as it marks the record computed
+        setattr_ = object.__setattr__
+        setattr_(self, 'names', tuple(names))
+        setattr_(self, 'kinds', tuple(kinds))
+        setattr_(self, 'types', MappingProxyType(types))
+        setattr_(self, 'defaults', MappingProxyType(defaults))
+        setattr_(self, 'desc', func.__doc__ or None)
+        setattr_(self, 'variadic', variadic)
+        setattr_(self, 'mode', func_mode(func))
+        setattr_(self, 'signature', signature)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        if key not in self.keys_:
+            raise KeyError(key)
+        value = getattr(self, key)
+        # names read as the legacy list
+        return list(value) if key == 'names' else value
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __repr__(self):
+        return f"FuncMeta({self.name})"
+
+    def signature_text(self):
+        """signature of the function as displayed in command descriptions"""
+        params = []
+        for name, param in self.signature.parameters.items():
+            text = name
+            # check if function contains annotations
+            if param.annotation is not inspect.Parameter.empty:
+                text = f"{name}: {getattr(param.annotation, '__name__', param.annotation)}"
+            # if default arg exists display in docs
+            if param.default is not inspect.Parameter.empty:
+                text = f"{text} = {param.default!r}"
+            params.append(text)
+
+        # define return type if exists for docs
+        text = f"{self.func.__name__}({', '.join(params)})"
+        if 'return' in self.types:
+            text = f"{text} -> {getattr(self.types['return'], '__name__', self.types['return'])}"
+        return text
 
 
 class Store:
@@ -10,37 +160,9 @@ class Store:
         self.log = None  # init logger object store
 
     def add_func(self, func):
-        """registers a function to the function dictionary"""
-        names = inspect.getfullargspec(func).args  # collect arg names
-        types = inspect.getfullargspec(func).annotations  # collect types of args
-        defaults = self._get_defaults(func)
-        desc = None
-        variadic = False
-
-        # if docstring exists and no description defined set desc
-        if func.__doc__:
-            desc = func.__doc__
-
-        # collect function signature to check if variadic [args, kwargs]
-        signature = inspect.signature(func)
-        for name, param in signature.parameters.items():
-            param_kind = signature.parameters[name].kind
-            variadic = param_kind in [inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD]
-            # correct names and types definition
-            if variadic:
-                names.append(str(param))
-                types = {}
-
-        # define function meta info
-        func_meta = {'func':func, 
-                    'names':names, 
-                    'types':types, 
-                    'defaults':defaults, 
-                    'desc':desc, 
-                    'variadic':variadic}
-        
+        """registers a function to the function dictionary, its meta info is computed when first needed"""
         # update function in store
-        self.funcs.update({func.__name__: func_meta})
+        self.funcs.update({func.__name__: FuncMeta(func)})
 
     def add_cli(self, cli_obj):
         """adds a cli object to the store"""
@@ -49,18 +171,3 @@ class Store:
     def add_log(self, log_obj):
         """adds a logger object to the store"""
         self.log = log_obj
-
-    @staticmethod
-    def _get_defaults(func):
-        """helper function to collect default func args"""
-
-        # get the signature of the function
-        sig = inspect.signature(func)
-
-        # collect a dictionary of default argument values
-        defaults = {}
-        for param in sig.parameters.values():
-            if param.default is not inspect.Parameter.empty:
-                defaults[param.name] = param.default
-
-        return defaults
@@ -0,0 +1,257 @@
+import json, enum, typing, types, argparse
+from array import array
+
+# converters compiled per annotation, shared by every signature using it
+CONVERTERS = {}
+
+# tokens read as None by optional annotations
+NONE_TOKENS = frozenset(('none', 'null'))
+
+# tokens read by bool annotations
+BOOL_TOKENS = {'true': True, '1': True, 'yes': True, 'y': True, 'on': True,
+               'false': False, '0': False, 'no': False, 'n': False, 'off': False}
+
+# X | Y annotations of python 3.10+
+UnionType = getattr(types, 'UnionType', None)
+
+
+def read_text(text):
+    '''text of an argument, the content of the file for @path arguments'''
+    if text[:1] != '@':
+        return text
+    try:
+        with open(text[1:]) as file:
+            return file.read()
+    except OSError as error:
+        raise argparse.ArgumentTypeError(f"cannot read {text[1:]}: {error.strerror}")
+
+
+def load_json(text):
+    '''json value of an argument or of an @file argument'''
+    return json.loads(read_text(text))
+
+
+def split(text):
+    '''tokens of a json list, comma or whitespace separated argument'''
+    text = read_text(text).strip()
+    if text[:1] == '[':
+        return json.loads(text)
+    return text.replace(',', ' ').split()
+
+
+def numbers(text, kind=None):
+    '''numbers of a json list, comma or whitespace separated argument parsed in bulk by the json decoder
+
+    :param kind: int or float, None keeps integers and floats as read
+    :return: list of numbers
+    '''
+    text = read_text(text).strip()
+    if text[:1] != '[':
+        if any(space in text for space in ' \t\r\n'):
+            text = ','.join(text.replace(',', ' ').split())
+        text = f"[{text}]"
+    try:
+        values = json.loads(text)
+    except ValueError:
+        # tokens json does not read, i.e. +1 or inf, convert one by one
+        return list(map(kind or float, text[1:-1].replace(',', ' ').split()))
+    if kind is float:
+        return list(map(float, values))
+    if kind is int and any(type(value) is not int for value in values):
+        raise ValueError("expected integers")
+    if kind is None and any(type(value) not in (int, float) for value in values):
+        raise ValueError("expected numbers")
+    return values
+
+
+def named(func, annotation):
+    '''name a converter after its annotation for argparse error messages'''
+    func.__name__ = getattr(annotation, '__name__', None) or str(annotation)
+    return func
+
+
+def convert_bool(text):
+    '''bool of a token, unlike bool() which is true for any non-empty string'''
+    try:
+        return BOOL_TOKENS[text.lower()]
+    except KeyError:
+        raise ValueError(text)
+
+
+def converter(annotation):
+    '''compile the converter of an annotation, called with an argument string
+
+    :param annotation: type annotation of a parameter
+    :return: callable or None to keep the string
+    '''
+    try:
+        return CONVERTERS[annotation]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable annotations are compiled every time
+        return compile_converter(annotation)
+    CONVERTERS[annotation] = func = compile_converter(annotation)
+    return func
+
+
+def compile_converter(annotation):
+    '''build the converter of an annotation, see converter'''
+    if annotation is None or annotation is str or annotation is typing.Any or isinstance(annotation, str):
+        return None
+    if annotation is bool:
+        return convert_bool
+
+    origin = getattr(annotation, '__origin__', None)
+    args = [arg for arg in getattr(annotation, '__args__', None) or () if not isinstance(arg, typing.TypeVar)]
+
+    # Optional and Union try each member in order
+    if origin is typing.Union or (UnionType is not None and isinstance(annotation, UnionType)):
+        members = [arg for arg in args if arg is not type(None)]
+        funcs = [converter(arg) or str for arg in members]
+        optional = len(members) < len(args)
+
+        def convert_union(text):
+            if optional and text.lower() in NONE_TOKENS:
+                return None
+            for func in funcs:
+                try:
+                    return func(text)
+                except (ValueError, TypeError, argparse.ArgumentTypeError):
+                    continue
+            raise ValueError(text)
+
+        return named(convert_union, annotation)
+
+    # sequences of items, numeric items parse in bulk
+    if origin in (list, tuple, set, frozenset) or annotation in (list, tuple, set, frozenset):
+        container = origin or annotation
+        if container is tuple and len(args) == 2 and args[1] is Ellipsis:
+            args = args[:1]
+        if container is tuple and len(args) > 1:
+            funcs = [converter(arg) or str for arg in args]
+
+            def convert_tuple(text):
+                tokens = split(text)
+                if len(tokens) != len(funcs):
+                    raise ValueError(text)
+                return tuple(func(token) for func, token in zip(funcs, tokens))
+
+            return named(convert_tuple, annotation)
+
+        item = converter(args[0]) if args else None
+
+        # numeric items parse in bulk
+        if item in (int, float):
+            def convert_numbers(text):
+                values = numbers(text, item)
+                return values if container is list else container(values)
+
+            return named(convert_numbers, annotation)
+
+        def convert_sequence(text):
+            tokens = split(text)
+            # every token converts in a single map
+            if item is not None:
+                tokens = map(item, tokens)
+            return container(tokens)
+
+        return named(convert_sequence, annotation)
+
+    # mappings from json objects
+    if origin is dict or annotation is dict:
+        value = converter(args[1]) if len(args) == 2 else None
+
+        def convert_dict(text):
+            data = load_json(text)
+            if not isinstance(data, dict):
+                raise ValueError(text)
+            if value is not None:
+                data = {key: item if not isinstance(item, str) else value(item) for key, item in data.items()}
+            return data
+
+        return named(convert_dict, annotation)
+
+    if isinstance(annotation, type):
+        # enums by member name or value
+        if issubclass(annotation, enum.Enum):
+            members = {str(member.value): member for member in annotation}
+
+            def convert_enum(text):
+                try:
+                    return annotation[text]
+                except KeyError:
+                    try:
+                        return members[text]
+                    except KeyError:
+                        raise ValueError(text)
+
+            return named(convert_enum, annotation)
+
+        # numeric buffers parse every token at once
+        if annotation is array:
+            def convert_array(text):
+                values = numbers(text)
+                # integers when every value is an integer
+                if all(type(value) is int for value in values):
+                    try:
+                        return array('q', values)
+                    except OverflowError:
+                        pass
+                return array('d', values)
+
+            return named(convert_array, annotation)
+
+        if annotation.__module__ == 'numpy' and annotation.__name__ == 'ndarray':
+            def convert_ndarray(text):
+                import numpy
+
+                text = read_text(text).strip()
+                if text[:1] == '[':
+                    return numpy.array(json.loads(text))
+                return numpy.fromstring(text.replace(',', ' '), sep=' ')
+
+            return named(convert_ndarray, annotation)
+
+        # dataclasses from json objects, fields converted from strings
+        fields = getattr(annotation, '__dataclass_fields__', None)
+        if fields is not None:
+            try:
+                hints = typing.get_type_hints(annotation)
+            except Exception:
+                hints = {name: field.type for name, field in fields.items()}
+            funcs = {name: converter(hints.get(name)) for name in fields}
+
+            def convert_dataclass(text):
+                data = load_json(text)
+                if not isinstance(data, dict):
+                    raise ValueError(text)
+                return annotation(**{key: funcs[key](item) if isinstance(item, str) and funcs.get(key) else item
+                                     for key, item in data.items()})
+
+            return named(convert_dataclass, annotation)
+
+    # classes taking a string, i.e. int, float, pathlib.Path
+    return annotation if callable(annotation) else None
+
+
+def resolve(func_meta):
+    '''annotations of a function with string annotations evaluated'''
+    types = dict(func_meta.types)
+    if any(isinstance(annotation, str) for annotation in types.values()):
+        try:
+            types.update(typing.get_type_hints(func_meta.func))
+        except Exception:
+            # unresolvable annotations stay strings
+            pass
+    return types
+
+
+def converters(func_meta):
+    '''converters of the parameters of a registered function
+
+    :param func_meta: meta_handler.FuncMeta of the function
+    :return: dict of parameter name to converter or None
+    '''
+    types = resolve(func_meta)
+    return {name: converter(types[name]) for name in func_meta.names if name in types}
@@ -1,7 +1,26 @@
 import sutools as su
+import timeit, asyncio, time, threading, tracemalloc, gc, math, multiprocessing, os, pytest, random, subprocess, sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from sutools import bench_handler
 
 
+##### Helpers
+
+export_benchy = bench_handler.Benchy()
+
+
+@export_benchy
+def func_export(x: int) -> int:
+    return x * 2
+
+
+def export_worker(n):
+    # worker processes flush their records when they exit
+    for i in range(n):
+        func_export(i)
+    return os.getpid()
+
+
 ##### Methods
 
 def test_benchy_and_register():
@@ -42,4 +61,656 @@ def test_benchy_and_register():
 
     # clear global registers
     su.benchy.report = {}
-    su.store.funcs = {}
\ No newline at end of file
+    su.store.funcs = {}
+
+def test_benchy_stream():
+    benchy = bench_handler.Benchy(stream=True)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    for i in range(1000):
+        func_add(i, 1)
+
+    # assert that calls were aggregated instead of stored
+    agg = benchy.report["func_add"]
+    assert isinstance(agg, bench_handler.Aggregate)
+    assert agg.calls == 1000
+    assert agg.samples is None
+    stats = agg["benchmark"].summary()
+    assert stats["count"] == 1000
+    assert stats["min"] <= stats["p50"] <= stats["p99"] <= stats["max"] * 1.01
+
+
+def test_benchy_stream_buffer():
+    benchy = bench_handler.Benchy(stream=True, buffer=5)
+
+    @benchy
+    def func_data(data: list) -> list:
+        return data
+
+    for i in range(20):
+        func_data([0] * i)
+
+    # assert that only the latest calls are kept in the ring buffer
+    samples = benchy.report["func_data"].samples
+    assert len(samples) == 5
+    assert samples[-1]["args"] == [{"type": "list", "length": 19}]
+
+
+def test_stats_merge():
+    values = [float(i) for i in range(1, 1001)]
+    left, right, full = bench_handler.Stats(), bench_handler.Stats(), bench_handler.Stats()
+    for value in values[:300]:
+        left.add(value)
+    for value in values[300:]:
+        right.add(value)
+    for value in values:
+        full.add(value)
+
+    merged = left.merge(right)
+
+    # assert that merged moments match a single pass
+    assert merged.count == full.count
+    assert merged.min == 1.0 and merged.max == 1000.0
+    assert abs(merged.mean - full.mean) < 1e-9
+    assert abs(merged.variance - full.variance) < 1e-6
+
+    # assert that sketch quantiles are within the relative accuracy
+    for q, expected in [(0.5, 500.5), (0.95, 950.05), (0.99, 990.01)]:
+        assert abs(merged.quantile(q) - expected) / expected < 0.02
+
+
+def test_sketch_negative_and_zero():
+    sketch = bench_handler.Sketch()
+    for value in [-100, -10, 0, 0, 10, 100]:
+        sketch.add(value)
+
+    assert sketch.quantile(0) < -90
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1) > 90
+    assert bench_handler.Sketch().quantile(0.5) is None
+
+
+def test_benchy_sample():
+    benchy = bench_handler.Benchy(sample=10)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    for i in range(100):
+        assert func_add(i, 1) == i + 1
+
+    # assert that only 1 in 10 calls was benchmarked
+    assert len(benchy.report["func_add"]) == 10
+
+
+def test_benchy_interval(monkeypatch):
+    benchy = bench_handler.Benchy(interval=1.0)
+    clock = iter([0.0, 0.0, 0.1, 0.5, 1.2, 1.2, 1.3, 1.5])
+    monkeypatch.setattr(bench_handler.time, "perf_counter", lambda: next(clock))
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    for i in range(4):
+        func_add(i, 1)
+
+    # assert that calls within the interval were skipped
+    assert len(benchy.report["func_add"]) == 2
+
+
+def test_benchy_disabled():
+    benchy = bench_handler.Benchy(enabled=False)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    assert func_add(1, 2) == 3
+    assert benchy.report == {}
+
+    # assert that the switch applies to already decorated functions
+    benchy.enabled = True
+    func_add(1, 2)
+    assert len(benchy.report["func_add"]) == 1
+
+
+def test_benchy_overhead(capsys):
+    def func_add(x, y):
+        return x + y
+
+    def passthrough(*args, **kwargs):
+        return func_add(*args, **kwargs)
+
+    modes = {
+        "disabled": bench_handler.Benchy(enabled=False),
+        "sample 1/1000": bench_handler.Benchy(sample=1000, stream=True),
+        "interval 1s": bench_handler.Benchy(interval=1.0, stream=True),
+        "stream": bench_handler.Benchy(stream=True),
+        "full": bench_handler.Benchy(),
+    }
+
+    def per_call(func, number=20000):
+        # best of several repeats to reduce scheduler noise
+        return min(timeit.repeat(lambda: func(1, 2), number=number, repeat=5)) / number
+
+    bare = per_call(func_add)
+    baseline = per_call(passthrough)
+    overhead = {name: per_call(benchy(func_add)) for name, benchy in modes.items()}
+
+    with capsys.disabled():
+        print(f"\nbare call: {bare * 1e9:.0f}ns, passthrough wrapper: {baseline * 1e9:.0f}ns")
+        for name, seconds in overhead.items():
+            print(f"benchy {name}: {seconds * 1e9:.0f}ns per call")
+
+    # assert that the disabled and sampled paths cost about as much as a plain wrapper
+    assert overhead["disabled"] < baseline * 3
+    assert overhead["sample 1/1000"] < overhead["full"]
+    assert overhead["interval 1s"] < overhead["full"]
+
+
+def test_benchy_async():
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    async def func_delay(x: int) -> int:
+        await asyncio.sleep(0.05)
+        return x
+
+    assert asyncio.iscoroutinefunction(func_delay)
+    assert asyncio.run(func_delay(1)) == 1
+
+    # assert that the time until completion was recorded
+    sample = benchy.report["func_delay"][0]
+    assert sample["benchmark"] >= 0.05
+    assert sample["result"] == {"type": "int", "value": 1}
+
+
+def test_benchy_generator():
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    def func_gen(n: int):
+        for i in range(n):
+            time.sleep(0.01)
+            yield i
+
+    assert list(func_gen(3)) == [0, 1, 2]
+
+    # assert that the generator was timed until exhausted
+    sample = benchy.report["func_gen"][0]
+    assert sample["items"] == 3
+    assert 0.01 <= sample["first"] < sample["benchmark"]
+    assert sample["benchmark"] >= 0.03
+    assert sample["throughput"] == 3 / sample["benchmark"]
+    assert sample["result"] == {"type": "generator", "length": 3}
+
+    # assert that a partially consumed generator is recorded when closed
+    gen = func_gen(10)
+    next(gen)
+    gen.close()
+    assert benchy.report["func_gen"][1]["items"] == 1
+
+
+def test_benchy_async_generator():
+    benchy = bench_handler.Benchy(stream=True)
+
+    @benchy
+    async def func_agen(n: int):
+        for i in range(n):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def consume():
+        return [item async for item in func_agen(3)]
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+
+    # assert that streaming metrics were aggregated
+    agg = benchy.report["func_agen"]
+    assert agg["items"].mean == 3
+    assert agg["first"].max < agg["benchmark"].max
+
+
+def test_benchy_generator_protocol():
+    closed = []
+
+    def accumulate():
+        total = 0
+        try:
+            while True:
+                try:
+                    value = yield total
+                except ValueError:
+                    value = -total
+                total += value or 0
+        finally:
+            closed.append(total)
+
+    async def aaccumulate():
+        total = 0
+        try:
+            while True:
+                try:
+                    value = yield total
+                except ValueError:
+                    value = -total
+                total += value or 0
+        finally:
+            closed.append(total)
+
+    async def adrive(agen):
+        return [await agen.__anext__(), await agen.asend(5), await agen.asend(3),
+                await agen.athrow(ValueError()), await agen.aclose()]
+
+    # assert send, throw and close reach the generator whether or not the call is benchmarked
+    for enabled in (True, False):
+        benchy = bench_handler.Benchy(enabled=enabled)
+        gen = benchy(accumulate)()
+        assert [next(gen), gen.send(5), gen.send(3), gen.throw(ValueError())] == [0, 5, 8, 0]
+        gen.close()
+        assert asyncio.run(adrive(benchy(aaccumulate)())) == [0, 5, 8, 0, None]
+        assert closed == [0, 0]
+        closed.clear()
+
+    # assert every produced item is counted
+    benchy = bench_handler.Benchy()
+    gen = benchy(accumulate)()
+    next(gen), gen.send(1), gen.close()
+    asyncio.run(adrive(benchy(aaccumulate)()))
+    assert benchy.report["accumulate"][0]["items"] == 2
+    assert benchy.report["aaccumulate"][0]["items"] == 4
+
+
+def test_benchy_threads():
+    benchy = bench_handler.Benchy()
+    barrier = threading.Barrier(8)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    def work(n):
+        # line up the workers so every thread records samples concurrently
+        barrier.wait()
+        return [func_add(i, n) for i in range(1000)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(8)))
+
+    # assert that no samples were lost and each thread was recorded
+    samples = benchy.report["func_add"]
+    assert len(samples) == 8000
+    assert len({sample["thread"] for sample in samples}) == 8
+
+    # assert that the stream mode merges the thread aggregates
+    benchy.report = {}
+    benchy.stream = True
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(8)))
+    assert benchy.report["func_add"].calls == 8000
+
+
+def test_benchy_stream_read_while_recording():
+    benchy = bench_handler.Benchy(stream=True, buffer=16)
+    stop = threading.Event()
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    def work(n):
+        count = 0
+        while not stop.is_set():
+            func_add(count, n)
+            count += 1
+        return count
+
+    # assert reads merge consistent aggregates while 4 threads record
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(work, n) for n in range(4)]
+        calls = 0
+        try:
+            for _ in range(500):
+                report = benchy.report
+                if "func_add" in report:
+                    aggregate = report["func_add"]
+                    assert aggregate.calls >= calls
+                    assert aggregate.calls == aggregate["benchmark"].count == aggregate["benchmark"].sketch.count
+                    calls = aggregate.calls
+        finally:
+            stop.set()
+        total = sum(future.result() for future in futures)
+
+    # assert no sample was lost
+    assert benchy.report["func_add"].calls == total
+
+
+def test_benchy_thread_churn():
+    benchy = bench_handler.Benchy(stream=True)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    # assert the buffers of finished threads are folded into one, keeping every call
+    for i in range(200):
+        thread = threading.Thread(target=lambda: [func_add(i, j) for j in range(5)])
+        thread.start()
+        thread.join()
+    assert len(benchy._buffers) <= 2
+    assert benchy.report["func_add"].calls == 1000
+    assert len(benchy._buffers) == 1
+
+    # assert call records of finished threads are kept
+    benchy = bench_handler.Benchy()
+    func_record = benchy(func_add.__wrapped__)
+    for i in range(50):
+        thread = threading.Thread(target=func_record, args=(i, 1))
+        thread.start()
+        thread.join()
+    assert len(benchy.report["func_add"]) == 50 and len(benchy._buffers) == 1
+
+
+def test_benchy_tasks():
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    async def func_delay(x: int) -> int:
+        await asyncio.sleep(0.01 * x)
+        return x
+
+    async def run():
+        tasks = [asyncio.create_task(func_delay(x), name=f"task-{x}") for x in range(5)]
+        return await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    # assert that each concurrent task has its own timing
+    samples = {sample["task"]: sample for sample in benchy.report["func_delay"]}
+    assert set(samples) == {f"task-{x}" for x in range(5)}
+    assert samples["task-4"]["benchmark"] > samples["task-0"]["benchmark"]
+
+
+def test_benchy_summarize():
+    benchy = bench_handler.Benchy()
+
+    class Container:
+        def __iter__(self):
+            return iter(())
+
+        def __len__(self):
+            raise AssertionError("len should not be called")
+
+    class Array:
+        shape = (2, 3)
+        dtype = "float64"
+        nbytes = 48
+
+    # assert that lazy or unknown iterables are not measured
+    assert benchy.summarize(i for i in range(3)) == {"type": "generator"}
+    assert benchy.summarize(Container()) == {"type": "Container"}
+    assert benchy.summarize([1, 2]) == {"type": "list", "length": 2}
+    assert benchy.summarize(3) == {"type": "int", "value": 3}
+    assert benchy.summarize(Array()) == {
+        "type": "Array", "shape": (2, 3), "dtype": "float64", "nbytes": 48
+    }
+
+    # assert that registered summarizers apply to subclasses
+    benchy.add_summarizer(Container, lambda data: {"type": "container"})
+
+    class SubContainer(Container):
+        pass
+
+    assert benchy.summarize(SubContainer()) == {"type": "container"}
+
+
+def test_benchy_lazy():
+    benchy = bench_handler.Benchy(lazy=True)
+    summarized = []
+
+    def summarize_data(data):
+        summarized.append(data)
+        return {"type": "list", "length": len(data)}
+
+    benchy.add_summarizer(list, summarize_data)
+
+    @benchy
+    def func_data(data: list) -> list:
+        return data
+
+    func_data([1, 2, 3])
+
+    # assert that summaries are only built when the report is read
+    assert summarized == []
+    sample = benchy.report["func_data"][0]
+    assert sample["args"] == [{"type": "list", "length": 3}]
+    assert sample["result"] == {"type": "list", "length": 3}
+    assert len(summarized) == 2
+
+    # assert that summaries are not rebuilt on later reads
+    benchy.report
+    assert len(summarized) == 2
+
+
+def test_benchy_memory():
+    benchy = bench_handler.Benchy(stream=True, memory=True, top=3)
+
+    @benchy
+    def func_alloc(n: int) -> int:
+        data = [bytearray(1024) for _ in range(n)]
+        return len(data)
+
+    @benchy
+    def func_retain(n: int) -> list:
+        return [bytearray(1024) for _ in range(n)]
+
+    try:
+        func_alloc(100)
+        func_alloc(1000)
+        retained = func_retain(1000)
+    finally:
+        tracemalloc.stop()
+
+    # assert that peak and net allocations were aggregated per function
+    agg = benchy.report["func_alloc"]
+    assert agg["peak"].max >= 1000 * 1024
+    assert agg["peak"].min < agg["peak"].max
+    assert abs(agg["net"].mean) < 100 * 1024
+    assert benchy.report["func_retain"]["net"].max >= len(retained) * 1024
+
+    # assert that the allocating line of the retained memory was recorded
+    line, size = benchy.report["func_retain"].top_lines(1)[0]
+    assert line.startswith(__file__) and size >= 1000 * 1024
+
+
+def test_benchy_cpu():
+    benchy = bench_handler.Benchy(cpu=True)
+
+    @benchy
+    def func_spin(n: int) -> int:
+        return sum(i * i for i in range(n))
+
+    @benchy
+    def func_sleep(seconds: float) -> None:
+        time.sleep(seconds)
+
+    @benchy
+    def func_garbage(n: int) -> None:
+        for _ in range(n):
+            node = {}
+            node["self"] = node
+        gc.collect()
+
+    func_spin(200000)
+    func_sleep(0.05)
+    func_garbage(10000)
+
+    # assert that cpu bound calls are distinguished from blocked calls
+    spin = benchy.report["func_spin"][0]
+    sleep = benchy.report["func_sleep"][0]
+    assert spin["thread_cpu"] > spin["benchmark"] * 0.5
+    assert spin["cpu"] >= spin["thread_cpu"] * 0.9
+    assert sleep["benchmark"] >= 0.05 and sleep["thread_cpu"] < 0.025
+
+    # assert that the collection triggered inside the call was timed
+    garbage = benchy.report["func_garbage"][0]
+    assert 0 < garbage["gc"] <= garbage["benchmark"]
+    assert sleep["gc"] == 0
+
+
+def test_benchy_export(tmp_path):
+    benchy = bench_handler.Benchy(export=str(tmp_path), flush_every=50)
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    @benchy
+    def func_gen(n: int):
+        yield from range(n)
+
+    for i in range(120):
+        func_add(i, 1)
+    list(func_gen(3))
+
+    # assert that records were flushed once the threshold was reached
+    assert len(benchy.report["func_add"]) == 20
+    path = benchy.flush()
+    assert benchy.report == {}
+
+    # assert that the columns were appended in record order
+    columns = bench_handler.load(path)
+    assert len(columns["func_add"]["benchmark"]) == 120
+    assert list(columns["func_gen"]["items"]) == [3.0]
+    assert "items" not in columns["func_add"]
+
+    # assert that the columns can be read zero copy
+    name, metric, values = next(bench_handler.read(path))
+    assert isinstance(values, memoryview) and values.format == "d"
+
+
+def test_benchy_lifetime():
+    import weakref
+
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    def func_add(x: int, y: int) -> int:
+        return x + y
+
+    func_add(1, 2)
+
+    # assert that a benchy no longer used is collected with its records
+    ref = weakref.ref(benchy)
+    del benchy, func_add
+    gc.collect()
+    assert ref() is None
+
+    # assert that flushing needs a folder
+    with pytest.raises(ValueError, match="path or an export folder"):
+        bench_handler.Benchy().flush()
+
+    # assert that stream mode is not exported silently
+    with pytest.raises(ValueError, match="stream mode"):
+        bench_handler.Benchy(stream=True, export="bench")
+    with pytest.raises(ValueError, match="stream mode"):
+        bench_handler.Benchy(stream=True).flush("bench")
+
+
+def test_benchy_export_merge(tmp_path):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("fork start method not available")
+
+    # assert that records of the parent are not exported by forked workers
+    func_export(1)
+    export_benchy.export = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    try:
+        with ProcessPoolExecutor(max_workers=2, mp_context=context) as pool:
+            pids = set(pool.map(export_worker, [100] * 4))
+    finally:
+        export_benchy.export = None
+        export_benchy.report = {}
+
+    # assert that the files of every worker are merged
+    assert len(bench_handler.files(str(tmp_path))) == len(pids)
+    report = bench_handler.merge(str(tmp_path))
+    assert report["func_export"].calls == 400
+    stats = report["func_export"]["benchmark"]
+    assert stats.count == 400 and not math.isnan(stats.mean)
+
+
+def test_compare():
+    rng = random.Random(1)
+    base = [rng.gauss(1.0, 0.05) for _ in range(200)]
+    columns = {
+        "func_same": {"benchmark": base},
+        "func_slow": {"benchmark": base},
+        "func_fast": {"benchmark": base},
+        "func_gone": {"benchmark": base},
+    }
+    current = {
+        "func_same": {"benchmark": [rng.gauss(1.0, 0.05) for _ in range(200)]},
+        "func_slow": {"benchmark": [rng.gauss(1.3, 0.05) for _ in range(200)]},
+        "func_fast": {"benchmark": [rng.gauss(0.7, 0.05) for _ in range(200)]},
+        "func_new": {"benchmark": [1.0]},
+    }
+
+    rows = {row["function"]: row for row in bench_handler.compare(columns, current, threshold=0.1)}
+
+    # assert that each function was classified
+    assert rows["func_same"]["status"] == "same"
+    assert rows["func_slow"]["status"] == "slower"
+    assert rows["func_fast"]["status"] == "faster"
+    assert rows["func_new"]["status"] == "new"
+    assert rows["func_gone"]["status"] == "missing"
+
+    # assert that the interval contains the observed ratio of medians
+    slow = rows["func_slow"]
+    assert slow["low"] <= slow["ratio"] <= slow["high"]
+    assert slow["p"] < 0.001 and rows["func_same"]["p"] > 0.001
+
+    assert "func_slow" in bench_handler.table(list(rows.values()))
+    with pytest.raises(AssertionError, match="func_slow"):
+        bench_handler.assert_no_regression(columns, current, threshold=0.1)
+
+
+def test_mann_whitney():
+    # assert that identical samples are not significant and shifted samples are
+    assert bench_handler.mann_whitney([1, 2, 3, 4], [1, 2, 3, 4]) == 1.0
+    assert bench_handler.mann_whitney(list(range(20)), list(range(100, 120))) < 1e-6
+    assert bench_handler.mann_whitney([1, 1, 1], [1, 1, 1]) == 1.0
+
+
+def test_baseline_cli(tmp_path):
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    def func_sleep(seconds: float) -> None:
+        time.sleep(seconds)
+
+    for _ in range(10):
+        func_sleep(0.001)
+    base = bench_handler.save_baseline("base", benchy, str(tmp_path))
+
+    benchy.report = {}
+    for _ in range(10):
+        func_sleep(0.02)
+    current = bench_handler.save_baseline("current", benchy, str(tmp_path))
+
+    # run the sutools package from the source tree
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(su.__file__)))
+
+    def run(*args):
+        return subprocess.run([sys.executable, "-m", "sutools", "compare", *args],
+                              capture_output=True, text=True, cwd=str(tmp_path), env=env)
+
+    # assert that the cli exits with 1 on regressions only
+    slower = run(base, current, "--threshold", "0.1")
+    assert slower.returncode == 1 and "slower" in slower.stdout
+    assert run(current, base).returncode == 0
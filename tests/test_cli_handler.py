@@ -1,6 +1,6 @@
 from unittest.mock import patch, Mock
-import sys, logging, argparse, pytest, asyncio
-from sutools import cli_handler, log_handler, meta_handler
+import sys, os, subprocess, logging, argparse, pytest, asyncio, time, threading
+from sutools import bench_handler, cli_handler, log_handler, meta_handler
 
 
 #### Fixtures
@@ -270,3 +270,521 @@ def test_variadic_func(capsys, monkeypatch, mock_atexit_register):
 
     # test variadic without args
     run_cli_parse({'command': 'func_test'})
+
+
+def func_square(x: int) -> int:
+    return x * x
+
+
+def test_bench_command(capsys, monkeypatch):
+    calls = []
+
+    def func_test(x: int, c: str = "-") -> str:
+        calls.append((x, c))
+        return c * x
+
+    store = meta_handler.Store()
+    store.add_func(func_test)
+
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert that the bench command was added next to the registered commands
+    cli_obj.build_all()
+    assert "bench" in cli_obj.subparsers.choices
+
+    monkeypatch.setattr(sys, "exit", lambda *args: None)
+
+    namespace = argparse.Namespace(
+        command="bench", target="func_test", args=["3", "-c", "+"],
+        number=10, repeat=3, warmup=2, procs=None
+    )
+
+    monkeypatch.setattr(
+        cli_handler.argparse.ArgumentParser, "parse_args",
+        lambda self, args=None: namespace if args is None else argparse.ArgumentParser.parse_known_args(self, args)[0]
+    )
+
+    cli_obj.parse()
+    captured = capsys.readouterr()
+
+    # assert that the command was warmed up, repeated and reported
+    assert calls == [(3, "+")] * 32
+    assert "func_test: 10 calls x 3 repeats" in captured.out
+    assert "median" in captured.out and "p95" in captured.out
+
+
+def test_bench_calibrate_procs():
+    store = meta_handler.Store()
+    store.add_func(func_square)
+
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert that the calls per repetition were calibrated and scaling was checked
+    report = cli_obj.bench("func_square", ["3"], repeat=2, procs=2)
+    number = int(report.split(": ")[1].split(" ")[0])
+    assert number >= 1000
+    assert "procs 2:" in report and "speedup" in report
+
+    # assert that benchmarked commands run in the workers without pickling them
+    benchy = bench_handler.Benchy()
+
+    @benchy
+    def func_cube(x: int) -> int:
+        return x ** 3
+
+    # register the original function like su.register
+    store.add_func(func_cube.__wrapped__)
+    cli_obj.add_funcs(store.funcs)
+    report = cli_obj.bench("func_cube", ["3"], number=10, repeat=2, procs=2)
+    assert "procs 2:" in report and "speedup" in report
+
+
+def test_bench_order_statistics(monkeypatch):
+    store = meta_handler.Store()
+    store.add_func(func_square)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert exact median and nearest rank p95 of the repetitions
+    times = iter([4.0, 1.0, 5.0, 2.0, 3.0])
+    monkeypatch.setattr(cli_handler, "timed", lambda *args: next(times))
+    report = cli_obj.bench("func_square", ["3"], number=1, repeat=5)
+    assert "min 1s  median 3s  p95 5s" in report
+    times = iter([2.0, 1.0])
+    report = cli_obj.bench("func_square", ["3"], number=1, repeat=2)
+    assert "min 1s  median 1.5s  p95 2s" in report
+
+
+def test_bench_async(monkeypatch):
+    async def func_test(x: float):
+        await asyncio.sleep(x)
+
+    store = meta_handler.Store()
+    store.add_func(func_test)
+
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert that coroutines were timed until completion
+    report = cli_obj.bench("func_test", ["0.01"], number=2, repeat=2, warmup=0)
+    assert "min 1" in report and "ms" in report
+
+    # assert that procs is reported as ignored for coroutines
+    report = cli_obj.bench("func_test", ["0"], number=2, repeat=2, warmup=0, procs=2)
+    assert "procs 2: ignored" in report
+
+
+def test_lazy_subparsers(capsys, monkeypatch):
+    monkeypatch.setattr(sys, "exit", lambda *args: None)
+
+    def make_store(count):
+        store = meta_handler.Store()
+        for i in range(count):
+            namespace = {}
+            exec(f"def func_{i}(x: int, y: int = 1) -> int:\n    return x + y", namespace)
+            store.add_func(namespace[f"func_{i}"])
+        return store
+
+    def startup(store):
+        # best of several runs of cli construction and dispatch of one command
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            cli_obj = cli_handler.CLI("description", False)
+            cli_obj.add_funcs(store.funcs)
+            cli_obj.parse(["func_0", "1", "-y", "2"])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return cli_obj, best
+
+    small, small_time = startup(make_store(10))
+    large, large_time = startup(make_store(1000))
+
+    with capsys.disabled():
+        print(f"\ncli startup: 10 commands {small_time * 1e3:.2f}ms, 1000 commands {large_time * 1e3:.2f}ms")
+
+    # assert that only the invoked command was built
+    assert list(large.subparsers.choices) == ["func_0"]
+    assert "3" in capsys.readouterr().out
+    assert large_time < small_time * 5 + 0.005
+
+    # assert that help builds every command
+    large.parse(["-h"])
+    assert len(large.subparsers.choices) == 1001
+    assert "func_999" in capsys.readouterr().out
+
+
+def test_spec_cache(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(sys, "exit", lambda *args: None)
+    module = tmp_path / "prog.py"
+    module.write_text("def func_add(x: int, y: int = 1) -> int:\n    return x + y\n")
+    monkeypatch.setattr(meta_handler, "prog_path", lambda: str(module))
+
+    namespace = {}
+    exec(module.read_text(), namespace)
+    store = meta_handler.Store()
+    store.add_func(namespace["func_add"])
+
+    # first run computes and saves the specifications
+    cli_obj = cli_handler.CLI("description", False, cache=tmp_path / "cache")
+    cli_obj.add_funcs(store.funcs)
+    cli_obj.parse(["func_add", "1", "-y", "2"])
+    assert capsys.readouterr().out == "3\n"
+
+    # a valid cache skips the specification computation
+    with patch.object(cli_handler, "command_spec") as command_spec:
+        cli_obj = cli_handler.CLI("description", False, cache=tmp_path / "cache")
+        cli_obj.add_funcs(store.funcs)
+        cli_obj.parse(["func_add", "3", "--y", "4"])
+        command_spec.assert_not_called()
+    assert capsys.readouterr().out == "7\n"
+
+    # completion reads the cache only
+    assert cli_handler.complete(module, ["func_"], tmp_path / "cache") == ["func_add"]
+    assert cli_handler.complete(module, ["func_add", "--"], tmp_path / "cache") == ["--y", "--help"]
+
+    # assert the package completes raw words, key=value words included
+    env = dict(os.environ, SUTOOLS_CACHE=str(tmp_path / "cache"),
+               PYTHONPATH=os.path.dirname(os.path.dirname(cli_handler.__file__)))
+    completed = subprocess.run([sys.executable, "-m", "sutools", "complete", "--", str(module), "func_add", "a=b", "--"],
+                               capture_output=True, text=True, env=env)
+    assert completed.returncode == 0 and completed.stdout.split() == ["--y", "--help"]
+
+    # a changed module invalidates the cache
+    module.write_text("def func_sub(x: int, y: int = 1) -> int:\n    return x - y\n")
+    assert cli_handler.SpecCache(module, tmp_path / "cache").load() == {}
+    assert cli_handler.complete(module, [""], tmp_path / "cache") == []
+
+    # a changed imported module invalidates the specifications of its functions
+    library = tmp_path / "lib.py"
+
+    def register(source):
+        library.write_text(source)
+        namespace = {}
+        exec(compile(source, str(library), "exec"), namespace)
+        store = meta_handler.Store()
+        store.add_func(namespace["func_greet"])
+        cli_obj = cli_handler.CLI("description", False, cache=tmp_path / "cache")
+        cli_obj.add_funcs(store.funcs)
+        return cli_obj
+
+    register("def func_greet(name, greeting='hi'):\n    return f'{greeting} {name}'\n").parse(["func_greet", "bob"])
+    assert capsys.readouterr().out == "hi bob\n"
+    cli_obj = register("def func_greet(name, greeting):\n    return f'{greeting} {name}'\n")
+    cli_obj.parse(["func_greet", "bob", "yo"])
+    assert capsys.readouterr().out == "yo bob\n"
+
+
+def test_server(tmp_path):
+    def func_greet(name: str, greeting: str = "hi") -> str:
+        return f"{greeting} {name}"
+
+    def func_upper():
+        return sys.stdin.read().upper()
+
+    def func_fail(code: int):
+        sys.exit(code)
+
+    store = meta_handler.Store()
+    for func in (func_greet, func_upper, func_fail):
+        store.add_func(func)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    path = str(tmp_path / "cli.sock")
+    server = cli_obj.server(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        # assert output, standard input and exit codes are forwarded
+        assert cli_handler.request(path, ["func_greet", "bob", "-gr", "yo"]) == {"stdout": "yo bob\n", "stderr": "", "code": 0}
+        assert cli_handler.request(path, ["func_upper"], "abc")["stdout"] == "ABC\n"
+        assert cli_handler.request(path, ["func_fail", "3"])["code"] == 3
+
+        # assert argparse errors do not stop the server
+        response = cli_handler.request(path, ["func_greet"])
+        assert response["code"] == 2 and "required" in response["stderr"]
+        assert cli_handler.request(path, ["func_greet", "ann"])["stdout"] == "hi ann\n"
+
+        # assert the socket of a running server is not taken over
+        with pytest.raises(FileExistsError, match="already running"):
+            cli_obj.server(path)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    # assert the socket file is removed
+    assert not (tmp_path / "cli.sock").exists()
+
+    # assert a stale socket is replaced and a regular file is left alone
+    import socket
+
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    cli_obj.server(path).server_close()
+    data = tmp_path / "data.txt"
+    data.write_text("keep")
+    with pytest.raises(FileExistsError, match="not a socket"):
+        cli_obj.server(str(data))
+    assert data.read_text() == "keep"
+
+
+def test_batch(tmp_path, capsys, monkeypatch):
+    def func_greet(name: str, greeting: str = "hi") -> str:
+        time.sleep(0.01 if name == "slow" else 0)
+        return f"{greeting} {name}"
+
+    def func_join(*args, **kwargs):
+        return ",".join(list(args) + [f"{key}={value}" for key, value in kwargs.items()])
+
+    store = meta_handler.Store()
+    store.add_func(func_greet)
+    store.add_func(func_join)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    lines = [
+        "func_greet slow",
+        "# comment",
+        "",
+        'func_greet "ann lee" -gr yo',
+        '["func_greet", "x"]',
+        '{"command": "func_greet", "args": ["y"], "kwargs": {"greeting": "hey"}}',
+        '{"command": "func_join", "args": ["a"], "kwargs": {"b": 1}}',
+        "func_greet",
+    ]
+    expected = [
+        (1, "hi slow", None),
+        (4, "yo ann lee", None),
+        (5, "hi x", None),
+        (6, "hey y", None),
+        (7, "a,b=1", None),
+        (8, None, "exit 2"),
+    ]
+
+    # assert results are in input order serially and in pools
+    assert list(cli_obj.batch(lines)) == expected
+    assert list(cli_obj.batch(lines, workers=3)) == expected
+    assert list(cli_obj.batch(lines, workers=3, pool="process")) == expected
+
+    # assert unordered results are yielded as completed
+    unordered = list(cli_obj.batch(lines, workers=3, ordered=False))
+    assert sorted(unordered, key=lambda result: result[0]) == expected
+    assert unordered[0][0] != 1
+
+    # assert the batch option prints results and exits with 1 on failures
+    batch_file = tmp_path / "batch.txt"
+    batch_file.write_text("\n".join(lines))
+    capsys.readouterr()
+    with pytest.raises(SystemExit) as exit_info:
+        cli_obj.parse(["--batch", str(batch_file), "--workers", "2"])
+    captured = capsys.readouterr()
+    assert captured.out == "hi slow\nyo ann lee\nhi x\nhey y\na,b=1\n"
+    assert "line 8: exit 2" in captured.err
+    assert exit_info.value.code == 1
+
+
+def test_event_loop(monkeypatch):
+    running = []
+    peak = []
+
+    async def func_loop() -> int:
+        return id(asyncio.get_event_loop())
+
+    async def func_wait(x: float) -> float:
+        running.append(x)
+        peak.append(len(running))
+        await asyncio.sleep(x)
+        running.remove(x)
+        return x
+
+    def func_sync(x: int) -> int:
+        return x * 2
+
+    store = meta_handler.Store()
+    for func in (func_loop, func_wait, func_sync):
+        store.add_func(func)
+
+    loops = []
+
+    def loop_factory():
+        loops.append(asyncio.new_event_loop())
+        return loops[-1]
+
+    cli_obj = cli_handler.CLI("description", False, loop_factory=loop_factory)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert async commands share one loop created by the factory
+    assert cli_obj.call(["func_loop"]) == cli_obj.call(["func_loop"]) == id(loops[0])
+    assert len(loops) == 1
+
+    # assert gather runs commands concurrently within the limit, sync commands in the executor
+    argvs = [["func_wait", "0.02"]] * 6 + [["func_sync", "4"]]
+    start = time.perf_counter()
+    results = cli_obj.gather(argvs, limit=3)
+    elapsed = time.perf_counter() - start
+    assert results == [0.02] * 6 + [8]
+    assert max(peak) == 3 and elapsed < 0.1
+
+    # assert failures are returned in place
+    results = cli_obj.gather([["func_wait"], ["func_sync", "1"]])
+    assert isinstance(results[0], SystemExit) and results[1] == 2
+
+    # assert the async batch pool yields results in order or as completed
+    lines = ["func_wait 0.03", "func_wait 0.01", "func_sync 2", "func_sync"]
+    expected = [(1, 0.03, None), (2, 0.01, None), (3, 4, None), (4, None, "exit 2")]
+    assert list(cli_obj.batch(lines, workers=2, pool="async")) == expected
+    unordered = list(cli_obj.batch(lines, workers=2, pool="async", ordered=False))
+    assert sorted(unordered, key=lambda result: result[0]) == expected
+    assert unordered[0][0] == 2
+    assert len(loops) == 1
+
+    # assert closing the cli closes its loops
+    cli_obj.close()
+    assert loops[0].is_closed()
+
+
+def test_map(capsys):
+    def func_power(*args, **kwargs):
+        time.sleep(0.02)
+        return int(args[0]) ** int(kwargs.get("power", 2))
+
+    async def func_wait(*args):
+        await asyncio.sleep(0.02)
+        return args[0]
+
+    def func_fixed(x: int):
+        return x
+
+    store = meta_handler.Store()
+    for func in (func_power, func_wait, func_fixed):
+        store.add_func(func)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert each pool calls the command per argument, keeping argument order
+    for pool in ("thread", "process", "async"):
+        start = time.perf_counter()
+        returned = cli_obj.call(["--map", pool, "--workers", "6", "--chunksize", "2",
+                                 "func_power", "1", "2", "3", "4", "5", "6", "power=3"])
+        assert returned == [1, 8, 27, 64, 125, 216]
+        if pool != "process":
+            assert time.perf_counter() - start < 0.1
+    assert cli_obj.call(["--map", "async", "func_wait", "a", "b"]) == ["a", "b"]
+    assert cli_obj.call(["--map", "thread", "func_wait", "a", "b"]) == ["a", "b"]
+    assert cli_obj.call(["--map", "process", "func_wait", "a", "b"]) == ["a", "b"]
+
+    # assert map results print one per line
+    cli_obj.run(["--map", "thread", "func_power", "2", "3"])
+    assert capsys.readouterr().out == "4\n9\n"
+
+    # assert map mode needs a variadic command
+    with pytest.raises(SystemExit):
+        cli_obj.call(["--map", "thread", "func_fixed", "1"])
+    assert "variadic" in capsys.readouterr().err
+    cli_obj.close()
+
+
+# test commands with parameters named like the cli options
+def test_option_names(capsys, monkeypatch):
+    def job(name: str, batch: int = 10, map: str = "viridis", serve: str = None, jsonl: bool = False,
+            workers: int = 2, pool: str = "x", unordered: bool = False, chunksize: int = 3):
+        return f"{name} {batch} {map} {serve} {jsonl} {workers} {pool} {unordered} {chunksize}"
+
+    store = meta_handler.Store()
+    store.add_func(job)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert the defaults of the command do not switch on cli modes
+    assert cli_obj.call(["job", "foo"]) == "foo 10 viridis None False 2 x False 3"
+    monkeypatch.setattr(sys, "argv", ["prog", "job", "foo", "--batch", "5", "--map", "magma"])
+    with pytest.raises(SystemExit):
+        cli_obj.parse()
+    assert capsys.readouterr().out == "foo 5 magma None False 2 x False 3\n"
+
+    # assert cli options still work next to the command parameters
+    cli_obj.run(["--jsonl", "job", "foo"])
+    assert capsys.readouterr().out == '"foo 10 viridis None False 2 x False 3"\n'
+
+
+def test_stream_output(capsys, monkeypatch):
+    events = []
+
+    def func_count(n: int):
+        for i in range(n):
+            events.append(f"yield {i}")
+            yield {"i": i}
+
+    async def func_acount(n: int):
+        for i in range(n):
+            await asyncio.sleep(0)
+            yield i
+
+    def func_rows(n: int):
+        return [[i, str(i)] for i in range(n)]
+
+    store = meta_handler.Store()
+    for func in (func_count, func_acount, func_rows):
+        store.add_func(func)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert generators, async generators and lists print as text
+    cli_obj.run(["func_count", "2"])
+    cli_obj.run(["func_acount", "3"])
+    cli_obj.run(["func_rows", "2"])
+    assert capsys.readouterr().out == "{'i': 0}\n{'i': 1}\n0\n1\n2\n[[0, '0'], [1, '1']]\n"
+
+    # assert json lines are printed per item of iterators and lists
+    cli_obj.run(["--jsonl", "func_count", "2"])
+    cli_obj.run(["--jsonl", "func_acount", "2"])
+    cli_obj.run(["--jsonl", "func_rows", "2"])
+    assert capsys.readouterr().out == '{"i": 0}\n{"i": 1}\n0\n1\n[0, "0"]\n[1, "1"]\n'
+
+    # assert items are written as they are produced
+    class Stdout:
+        def write(self, text):
+            events.append(f"write {text.strip()}")
+
+        def flush(self):
+            pass
+
+    events.clear()
+    monkeypatch.setattr(sys, "stdout", Stdout())
+    cli_obj.run(["--jsonl", "func_count", "2"])
+    assert events == ['yield 0', 'write {"i": 0}', 'yield 1', 'write {"i": 1}']
+    cli_obj.close()
+
+
+def test_typed_arguments(tmp_path):
+    import enum, typing
+
+    class Mode(enum.Enum):
+        fast = "f"
+        slow = "s"
+
+    def func_typed(values: typing.List[int], mode: Mode = Mode.fast, limit: typing.Optional[int] = None,
+                   verbose: bool = False, options: dict = None):
+        return values, mode, limit, verbose, options
+
+    store = meta_handler.Store()
+    store.add_func(func_typed)
+    cli_obj = cli_handler.CLI("description", False)
+    cli_obj.add_funcs(store.funcs)
+
+    # assert complex annotations are converted by argparse
+    values = tmp_path / "values.json"
+    values.write_text("[1, 2, 3]")
+    returned = cli_obj.call(["func_typed", f"@{values}", "--mode", "slow", "--limit", "none",
+                             "--verbose", "false", "--options", '{"a": 1}'])
+    assert returned == ([1, 2, 3], Mode.slow, None, False, {"a": 1})
+    assert cli_obj.call(["func_typed", "4,5", "--mode", "s", "--limit", "2"])[:3] == ([4, 5], Mode.slow, 2)
+
+    # assert invalid values are argparse errors
+    with pytest.raises(SystemExit):
+        cli_obj.call(["func_typed", "4,5", "--mode", "medium"])
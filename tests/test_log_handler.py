@@ -544,3 +544,391 @@ def test_out_folder_fail(capsys, mock_os, mock_atexit_register):
 
         # Verify that the getsize method was called once
         mock_os.path.getsize.assert_called_once_with(folder)
+
+
+# Test 12: test queue mode writes records from the listener thread and flushes in out
+def test_queue(tmp_path, mock_atexit_register, capsys):
+    class SlowFileHandler(logging.FileHandler):
+        # a file handler on a slow disk, the write releases the GIL like blocking io
+        def emit(self, record):
+            time.sleep(0.0002)
+            super().emit(record)
+
+    def make_logger(name, queue):
+        path = tmp_path / f"{name}.log"
+        log_obj = log_handler.Logger(
+            name, [name], logging.INFO, name, str(path),
+            logging.Formatter("%(name)s %(levelname)s %(message)s"),
+            SlowFileHandler(path, "w"), None, None, True, None, None, False,
+            queue=queue,
+        )
+        return log_obj, path
+
+    def timed(logger):
+        start = time.perf_counter()
+        for i in range(1000):
+            logger.info("record %d", i)
+        return time.perf_counter() - start
+
+    sync_obj, sync_path = make_logger("sync_log", False)
+    queue_obj, queue_path = make_logger("queue_log", True)
+    sync_time = timed(sync_obj.loggers.sync_log)
+    queue_time = timed(queue_obj.loggers.queue_log)
+    with capsys.disabled():
+        print(f"\n1000 records on a slow disk: file handler {sync_time * 1e3:.1f}ms, queue {queue_time * 1e3:.1f}ms")
+    assert queue_time < sync_time
+
+    # assert every queued record is written once out drains the queue
+    listener = queue_obj.listener
+    queue_obj.out()
+    sync_obj.out()
+    assert not listener.is_alive()
+    lines = queue_path.read_text().splitlines()
+    assert len(lines) == 1000 and lines[-1] == "queue_log INFO record 999"
+    assert queue_path.read_text() == sync_path.read_text().replace("sync_log", "queue_log")
+
+
+# Test 13: test the overflow policies of a full queue
+@pytest.mark.parametrize("overflow, expected", [("drop", ["0", "1"]), ("drop-oldest", ["3", "4"])])
+def test_queue_overflow(overflow, expected, capsys):
+    from queue import Queue
+
+    handler = log_handler.QueueHandler(Queue(2), overflow)
+    logger = logging.getLogger(f"overflow_{overflow}")
+    logger.propagate = False
+    logger.handlers = [handler]
+
+    # assert a full queue drops records without blocking the caller
+    for i in range(5):
+        logger.warning(str(i))
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == expected
+
+    with pytest.raises(ValueError):
+        log_handler.QueueHandler(Queue(2), "grow")
+
+
+# Test 14: test the flush policies of the buffered file handler
+def test_buffered_file_handler(tmp_path):
+    def make_logger(name, handler):
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        logger = logging.getLogger(name)
+        logger.propagate = False
+        logger.handlers = [handler]
+        logger.setLevel(logging.INFO)
+        return logger
+
+    path = tmp_path / "buffered.log"
+    handler = log_handler.BufferedFileHandler(path, "w", buffer_size=1000, flush_interval=None)
+    logger = make_logger("buffered", handler)
+
+    # assert records are buffered until the buffer is full
+    for i in range(10):
+        logger.info("record %d", i)
+    assert path.read_text() == ""
+    for i in range(100):
+        logger.info("record %d", i)
+    assert 1000 <= len(path.read_text()) < 1100
+
+    # assert records at the flush level are written immediately
+    logger.error("failure")
+    assert path.read_text().endswith("ERROR failure\n")
+
+    # assert closing writes the buffer
+    logger.info("last")
+    handler.close()
+    assert path.read_text().endswith("INFO last\n")
+
+    # assert the timer writes the buffer of an idle logger
+    path = tmp_path / "timed.log"
+    handler = log_handler.BufferedFileHandler(path, "w", flush_interval=0.05)
+    logger = make_logger("timed", handler)
+    logger.info("idle")
+    assert path.read_text() == ""
+    time.sleep(0.2)
+    assert path.read_text() == "INFO idle\n"
+    handler.close()
+    handler.timer.join(1)
+    assert not handler.timer.is_alive()
+
+
+# Test 15: test buffered writes take fewer flushes than the file handler
+def test_buffered_flushes(tmp_path, capsys):
+    def flushes(handler):
+        logger = logging.getLogger(f"flushes_{type(handler).__name__}")
+        logger.propagate = False
+        logger.handlers = [handler]
+        logger.setLevel(logging.INFO)
+        calls = []
+        flush = handler.stream.flush
+        handler.stream.flush = lambda: calls.append(1) or flush()
+
+        start = time.perf_counter()
+        for i in range(10000):
+            logger.info("record %d", i)
+        handler.close()
+        return len(calls), time.perf_counter() - start
+
+    file_flushes, file_time = flushes(logging.FileHandler(tmp_path / "file.log", "w"))
+    buffered_flushes, buffered_time = flushes(log_handler.BufferedFileHandler(tmp_path / "buffered.log", "w"))
+    with capsys.disabled():
+        print(f"\n10000 records: file handler {file_flushes} flushes {file_time * 1e3:.1f}ms, "
+              f"buffered {buffered_flushes} flushes {buffered_time * 1e3:.1f}ms")
+    assert buffered_flushes < file_flushes / 100
+    assert (tmp_path / "file.log").read_text() == (tmp_path / "buffered.log").read_text()
+
+
+# Test 16: test json lines hold the time, name, level, message, extras and exceptions
+def test_json_formatter():
+    import json
+
+    formatter = log_handler.JsonFormatter()
+    record = logging.LogRecord("json", logging.WARNING, __file__, 1, "hello %s", ("there",), None)
+    record.__dict__.update({"user": "ann", "obj": object()})
+    data = json.loads(formatter.format(record))
+    assert data["name"] == "json"
+    assert data["level"] == "WARNING"
+    assert data["message"] == "hello there"
+    assert data["user"] == "ann"
+    assert data["obj"].startswith("<object")
+    assert data["time"] == time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+    # assert exceptions are formatted tracebacks
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.LogRecord("json", logging.ERROR, __file__, 1, "boom", None, sys.exc_info())
+    data = json.loads(formatter.format(record))
+    assert "ZeroDivisionError" in data["exc_info"]
+
+    # assert custom fields
+    formatter = log_handler.JsonFormatter({"logger": "name", "line": "lineno"})
+    assert json.loads(formatter.format(record)).keys() == {"time", "logger", "line", "exc_info"}
+
+
+# Test 17: test threads sharing a json formatter stamp each record with its own second
+def test_json_formatter_threads():
+    import json, threading
+
+    formatter = log_handler.JsonFormatter()
+    errors = []
+
+    def work(offset):
+        for i in range(2000):
+            record = logging.LogRecord("json", logging.INFO, __file__, 1, "tick", None, None)
+            record.created = 1700000000 + offset + i % 2
+            expected = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(int(record.created)))
+            if not json.loads(formatter.format(record))["time"].startswith(expected):
+                errors.append(record.created)
+
+    # switch threads often to interleave the formatting
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work, args=(offset * 2,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+
+# Test 18: test the json formatter keeps pace with the text formatter
+def test_json_formatter_speed(capsys):
+    def timing(formatter):
+        record = logging.LogRecord("bench", logging.INFO, __file__, 1, "record %d", (1,), None)
+        start = time.perf_counter()
+        for _ in range(20000):
+            formatter.format(record)
+        return time.perf_counter() - start
+
+    text_time = timing(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    json_time = timing(log_handler.JsonFormatter())
+    with capsys.disabled():
+        print(f"\n20000 records: text formatter {text_time * 1e3:.1f}ms, json formatter {json_time * 1e3:.1f}ms")
+    assert json_time < text_time * 2
+
+
+# Test 19: test size rotation starts new files and prunes them with filecap
+def test_rotate_size(tmp_path, mock_atexit_register, monkeypatch, capsys):
+    monkeypatch.setattr(log_handler.Logger, "poll", 0.01)
+    path = tmp_path / "rotate_size" / "first.log"
+    path.parent.mkdir()
+    log_obj = log_handler.Logger(
+        "rotate_size", ["rotate_size"], logging.INFO, "first", str(path),
+        logging.Formatter("%(message)s"), logging.FileHandler(path, "w"), 3, None, True, None, None, False,
+        rotate_size=1000,
+    )
+    logger = log_obj.loggers.rotate_size
+
+    # assert logging continues in new files once the file is over the size
+    for i in range(5):
+        for j in range(100):
+            logger.info("record %d %d", i, j)
+        deadline = time.monotonic() + 2
+        while log_obj.filepath == str(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        path = log_obj.filepath
+
+    # assert pruning on rotation keeps filecap files with the newest records
+    log_obj.out()
+    files = list((tmp_path / "rotate_size").iterdir())
+    assert len(files) <= 3
+    lines = sum((file.read_text().splitlines() for file in files), [])
+    assert "record 4 99" in lines and "record 0 0" not in lines
+    assert all(os.path.getsize(file) > 0 for file in files)
+
+    # assert pruning on rotation does not print into the output of the process
+    assert capsys.readouterr().out == ""
+
+
+# Test 20: test interval rotation from the queue listener thread and the su.logger options
+def test_rotate_interval(tmp_path, mock_atexit_register, monkeypatch):
+    monkeypatch.setattr(log_handler.Logger, "poll", 0.01)
+    path = tmp_path / "rotate_interval" / "first.log"
+    path.parent.mkdir()
+    log_obj = log_handler.Logger(
+        "rotate_interval", ["rotate_interval"], logging.INFO, "first", str(path),
+        logging.Formatter("%(message)s"), logging.FileHandler(path, "w"), None, None, True, None, None, False,
+        queue=True, rotate_interval=0.05,
+    )
+    logger = log_obj.loggers.rotate_interval
+    for i in range(20):
+        logger.info("record %d", i)
+        time.sleep(0.02)
+    log_obj.out()
+
+    # assert every record is written once across the rotated files
+    files = list((tmp_path / "rotate_interval").iterdir())
+    assert len(files) > 1
+    lines = sorted(sum((file.read_text().splitlines() for file in files), []), key=lambda line: int(line.split()[1]))
+    assert lines == [f"record {i}" for i in range(20)]
+
+    # assert period strings and invalid units
+    with patch("warnings.warn") as mock_warn:
+        log_obj = log_handler.Logger(
+            "rotate_period", ["rotate_period"], logging.INFO, "first", str(path),
+            None, logging.FileHandler(path, "w"), None, None, True, None, None, False, rotate_interval="1z",
+        )
+        mock_warn.assert_called_once_with("Invalid time unit: z", Warning)
+    log_obj.out()
+    log_obj = log_handler.Logger(
+        "rotate_period", ["rotate_period"], logging.INFO, "first", str(path),
+        None, logging.FileHandler(path, "w"), None, None, True, None, None, False, rotate_interval="2h",
+    )
+    assert log_obj.rotate_interval == 7200
+    log_obj.out()
+
+
+# Test 21: test rotation follows the file of a handler given by the caller
+def test_rotate_handler_file(tmp_path, mock_atexit_register, monkeypatch):
+    monkeypatch.setattr(log_handler.Logger, "poll", 0.01)
+    path = tmp_path / "logs" / "first.log"
+    path.parent.mkdir()
+    custom = tmp_path / "custom" / "custom.log"
+    custom.parent.mkdir()
+    log_obj = log_handler.Logger(
+        "rotate_custom", ["rotate_custom"], logging.INFO, "first", str(path),
+        logging.Formatter("%(message)s"), logging.FileHandler(custom, "w"), None, None, True, None, None, False,
+        rotate_size=100,
+    )
+    logger = log_obj.loggers.rotate_custom
+    for i in range(100):
+        logger.info("record %d", i)
+    deadline = time.monotonic() + 2
+    while log_obj.fhandler.baseFilename == str(custom) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    logger.info("rotated")
+    log_obj.out()
+
+    # assert the file was rotated next to the handler file, keeping its name
+    files = sorted(file.name for file in custom.parent.iterdir())
+    assert files[0] == "custom.log" and len(files) == 2 and files[1].startswith("custom_")
+    assert (custom.parent / files[1]).read_text() == "rotated\n"
+    assert not path.exists()
+
+
+def run_forked(child, timeout=5):
+    # run child in a forked process, failing when it hangs or raises
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            child()
+        except BaseException:
+            code = 1
+        os._exit(code)
+    deadline = time.monotonic() + timeout
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status)
+        if time.monotonic() > deadline:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+            pytest.fail("forked child hung")
+        time.sleep(0.01)
+
+
+# Test 22: test forked children of a queued logger write their records directly
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not available")
+def test_queue_fork(tmp_path, mock_atexit_register):
+    path = tmp_path / "fork.log"
+    log_obj = log_handler.Logger(
+        "queue_fork", ["queue_fork"], logging.INFO, "fork", str(path),
+        logging.Formatter("%(message)s"), logging.FileHandler(path, "w"), None, None, True, None, None, False,
+        queue=True, queue_size=5,
+    )
+    logger = log_obj.loggers.queue_fork
+    logger.info("parent")
+
+    # assert the child neither blocks on the full copied queue nor loses its records
+    def child():
+        for i in range(20):
+            logger.info("child %d", i)
+
+    assert run_forked(child) == 0
+    log_obj.out()
+    lines = path.read_text().splitlines()
+    assert lines.count("parent") == 1
+    assert [line for line in lines if line.startswith("child")] == [f"child {i}" for i in range(20)]
+
+
+# Test 23: test forked children of a buffered handler write only their own records
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not available")
+def test_buffered_fork(tmp_path):
+    import multiprocessing
+
+    path = tmp_path / "fork.log"
+    handler = log_handler.BufferedFileHandler(path, "w", flush_interval=None)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("buffered_fork")
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.info("parent pending")
+
+    # assert the child does not write the parent buffer again and writes its own at exit
+    def child():
+        logger.error("child error")
+        logger.info("child pending")
+        assert handler.timer is None
+
+    def forked_child():
+        logger.info("plain fork")
+        assert handler.buffer == ["plain fork\n"]
+
+    process = multiprocessing.get_context("fork").Process(target=child)
+    process.start()
+    process.join(5)
+    assert process.exitcode == 0
+    assert run_forked(forked_child) == 0
+    handler.close()
+    assert path.read_text().splitlines() == ["child error", "child pending", "parent pending"]
+
+    # assert the timer is restarted in the child
+    handler = log_handler.BufferedFileHandler(tmp_path / "timed.log", "w", flush_interval=0.05)
+    assert run_forked(lambda: handler.timer.is_alive() or sys.exit(1)) == 0
+    handler.close()
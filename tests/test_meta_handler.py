@@ -1,5 +1,5 @@
 from unittest.mock import Mock
-import logging, pytest
+import logging, pytest, sys, types, time, inspect
 from sutools import meta_handler, cli_handler, log_handler
 
 #### Fixtures
@@ -86,3 +86,103 @@ def test_add_log(mock_atexit_register):
 
     # Assert that the Logger object was added correctly
     assert isinstance(store.log, log_handler.Logger)
+
+
+# Define a test function for the prog_name helper of meta_handler
+def test_prog_name(monkeypatch):
+    # assert that inspect.stack is never used to name the program
+    monkeypatch.setattr(meta_handler.inspect, "stack", Mock(side_effect=AssertionError))
+
+    # a script is named by its file
+    main = types.ModuleType("__main__")
+    main.__file__ = "/path/to/module.py"
+    main.__spec__ = None
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    assert meta_handler.prog_name() == "module"
+
+    # a module run with -m is named by its spec
+    main.__spec__ = types.SimpleNamespace(name="package.__main__")
+    assert meta_handler.prog_name() == "package"
+    main.__spec__ = types.SimpleNamespace(name="package.tool")
+    assert meta_handler.prog_name() == "tool"
+
+    # an interpreter without a main file is named by its outermost frame
+    main.__spec__ = None
+    del main.__file__
+    frame = sys._getframe()
+    while frame.f_back:
+        frame = frame.f_back
+    expected = frame.f_code.co_filename.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    assert meta_handler.prog_name() == expected
+
+    assert cli_handler.CLI("desc", False).name == expected
+
+
+# Define a test function for the FuncMeta record of meta_handler
+def test_func_meta():
+    async def func_test(x: int, y: str = "a", *args, z=1, **kwargs) -> int:
+        '''test function'''
+
+    meta = meta_handler.FuncMeta(func_test)
+
+    # assert the record fields
+    assert meta.name == "func_test"
+    assert meta.names == ("x", "y", "*args", "**kwargs")
+    assert meta.kinds == ("POSITIONAL_OR_KEYWORD", "POSITIONAL_OR_KEYWORD", "VAR_POSITIONAL", "KEYWORD_ONLY", "VAR_KEYWORD")
+    assert dict(meta.defaults) == {"y": "a", "z": 1}
+    assert meta.desc == "test function"
+    assert meta.variadic and meta.mode == "coroutine"
+
+    # assert the record reads as the legacy mapping
+    assert dict(meta) == {"func": func_test, "names": ["x", "y", "*args", "**kwargs"], "types": {},
+                          "defaults": {"y": "a", "z": 1}, "desc": "test function", "variadic": True}
+
+    # assert the record is immutable
+    with pytest.raises(AttributeError):
+        meta.desc = "changed"
+    with pytest.raises(TypeError):
+        meta.defaults["y"] = "b"
+
+
+# Define a registration benchmark for modules registering many functions
+def test_register_benchmark(monkeypatch, capsys):
+    funcs = []
+    for i in range(500):
+        namespace = {}
+        exec(f"def func_{i}(x: int, y: str = 'a', z: float = 1.0) -> int:\n    '''doc'''", namespace)
+        funcs.append(namespace[f"func_{i}"])
+
+    def legacy(func):
+        # introspection of the former Store.add_func
+        inspect.getfullargspec(func).args
+        inspect.getfullargspec(func).annotations
+        inspect.signature(func)
+        inspect.signature(func)
+        inspect.signature(func)
+
+    def best(register):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for func in funcs:
+                register(func)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    store = meta_handler.Store()
+    legacy_time, store_time = best(legacy), best(store.add_func)
+    compute_time = best(lambda func: meta_handler.FuncMeta(func).names)
+    with capsys.disabled():
+        print(f"\nregister 500 functions: legacy {legacy_time * 1e3:.2f}ms, deferred {store_time * 1e3:.2f}ms, "
+              f"computed {compute_time * 1e3:.2f}ms")
+
+    # assert registration defers the signature, computed once on first use
+    calls = []
+    signature = inspect.signature
+    monkeypatch.setattr(meta_handler.inspect, "signature", lambda func: calls.append(func) or signature(func))
+    store.add_func(funcs[0])
+    assert calls == []
+    meta = store.funcs["func_0"]
+    assert meta.names == ("x", "y", "z") and meta["defaults"] == {"y": "a", "z": 1.0}
+    assert calls == [funcs[0]]
+    assert store_time < compute_time < legacy_time
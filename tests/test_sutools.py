@@ -1,5 +1,5 @@
 from unittest.mock import patch, Mock, mock_open
-import inspect, pytest, sys, argparse, logging
+import inspect, pytest, sys, argparse, logging, os, subprocess, json
 import sutools as su
 
 
@@ -228,4 +228,38 @@ def test_logger_cli(capsys, mock_os, mock_atexit_register, monkeypatch):
 
     captured = capsys.readouterr()
 
-    assert expected_log in captured.out
\ No newline at end of file
+    assert expected_log in captured.out
+
+#### Startup
+
+
+# Test 7: this should benchmark the import of sutools in a fresh interpreter
+# the result should be that importing sutools never calls inspect.stack()
+# and does not import modules only needed by optional features
+def test_import_time(capsys):
+    code = (
+        "import inspect, json, sys, time\n"
+        "inspect.stack = None\n"
+        "start = time.perf_counter()\n"
+        "import sutools\n"
+        "elapsed = time.perf_counter() - start\n"
+        "heavy = ['asyncio', 'multiprocessing', 'concurrent.futures', 'socket', 'statistics']\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': [m for m in heavy if m in sys.modules],\n"
+        "                  'name': sutools.logger.__defaults__[0]}))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(su.__file__)))
+
+    # best of several runs to reduce scheduler noise
+    runs = [
+        json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True,
+                                  text=True, env=env, check=True).stdout)
+        for _ in range(3)
+    ]
+    elapsed = min(run["elapsed"] for run in runs)
+
+    with capsys.disabled():
+        print(f"\nimport sutools: {elapsed * 1000:.1f}ms")
+
+    assert runs[0]["loaded"] == []
+    assert runs[0]["name"] == "<string>"
+    assert elapsed < 1.0